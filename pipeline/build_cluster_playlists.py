@@ -0,0 +1,103 @@
+import typer
+import duckdb
+import numpy as np
+from prefect import flow, task, get_run_logger
+from duckdb import DuckDBPyConnection
+from typing import List
+from migrations import run_migrations_task
+from clusters import (
+    load_feature_vectors,
+    load_cluster_model,
+    save_cluster_model,
+    save_track_clusters,
+    remove_departed_tracks,
+    save_cluster_playlists,
+)
+from spotify_smart_playlists.playlists import (
+    AUDIO_FEATURES,
+    ClusterModel,
+    fit_cluster_model,
+    assign_clusters,
+)
+
+
+@task(name="Fit cluster model")
+def fit_cluster_model_task(
+    vectors: np.ndarray, num_clusters: int
+) -> ClusterModel:
+    logger = get_run_logger()
+    return fit_cluster_model(
+        vectors, AUDIO_FEATURES, num_clusters, logger=logger
+    )
+
+
+@task(name="Save cluster playlists")
+def save_cluster_playlists_task(
+    database: DuckDBPyConnection,
+    model: ClusterModel,
+    previous_names: List[str],
+    track_ids: np.ndarray,
+    labels: np.ndarray,
+    refit: bool,
+):
+    logger = get_run_logger()
+    database.begin()
+    try:
+        if refit:
+            save_cluster_model(database, model)
+        assigned = save_track_clusters(
+            database, track_ids, labels, replace_all=refit
+        )
+        removed = remove_departed_tracks(database)
+        added = save_cluster_playlists(database, previous_names)
+        database.commit()
+    except Exception:
+        database.rollback()
+        raise
+    logger.info(
+        f"Assigned {assigned} tracks, removed {removed} that left the "
+        f"library, added {added} cluster playlist rows."
+    )
+
+
+@flow(name="Build cluster playlists")
+def build_cluster_playlists(
+    database_file: str = "spotify.db",
+    num_clusters: int = 12,
+    recluster: bool = False,
+):
+    logger = get_run_logger()
+
+    database = duckdb.connect(database_file)
+    run_migrations_task(database)
+    model = load_cluster_model(database)
+    previous_names = model.names if model is not None else []
+
+    # Compared to what was asked for, a library smaller than num_clusters
+    # gets fewer clusters and would otherwise be refit every run.
+    refit = (
+        recluster or model is None or model.requested_clusters != num_clusters
+    )
+    # Once there's a model, new tracks just join their nearest cluster -
+    # pass recluster to start over.
+    track_ids, vectors = load_feature_vectors(
+        database, unassigned_only=not refit
+    )
+    if refit and not len(track_ids):
+        logger.info("No tracks to cluster.")
+        database.close()
+        return
+    if refit:
+        model = fit_cluster_model_task(vectors, num_clusters)
+    # Even with nothing new to assign, tracks that left the library still
+    # have to come out of the playlists.
+    logger.info(f"Assigning {len(track_ids)} tracks to clusters.")
+    labels = assign_clusters(model, vectors)
+    save_cluster_playlists_task(
+        database, model, previous_names, track_ids, labels, refit
+    )
+    database.close()
+
+
+if __name__ == "__main__":
+    typer.run(build_cluster_playlists)
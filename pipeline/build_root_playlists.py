@@ -3,13 +3,23 @@ from prefect import flow, task, get_run_logger
 from pathlib import Path
 import duckdb
 import polars as pl
-from database import save_to_database
+from migrations import run_migrations_task
+from track_facts import refresh_track_facts
+from rotation_policies import save_rotation_policies
+from root_playlist_cache import (
+    get_cached_keys,
+    get_play_stats_version,
+    root_playlist_cache_keys,
+    save_root_playlists,
+)
 from duckdb import DuckDBPyConnection
-from typing import List
+from typing import Dict, List
 from spotify_smart_playlists.playlists import (
     PlaylistConfig,
     playlist_config_from_dict,
-    make_root_playlist,
+    make_root_playlists,
+    load_track_facts_snapshot,
+    evaluate_playlists,
 )
 import yaml
 
@@ -29,39 +39,134 @@ def get_playlist_configs_task(
     return playlist_configs
 
 
-@task(name="Make root playlist")
-def make_root_playlist_task(
-    database: DuckDBPyConnection, playlist_config: PlaylistConfig
+@task(name="Refresh track facts")
+def refresh_track_facts_task(database: DuckDBPyConnection) -> str:
+    logger = get_run_logger()
+    return refresh_track_facts(database, logger=logger)
+
+
+@task(name="Save rotation policies")
+def save_rotation_policies_task(
+    database: DuckDBPyConnection, playlist_configs: List[PlaylistConfig]
+):
+    logger = get_run_logger()
+    database.begin()
+    try:
+        changed = save_rotation_policies(database, playlist_configs)
+        database.commit()
+    except Exception:
+        database.rollback()
+        raise
+    logger.info(f"Updated {changed} rotation policies.")
+
+
+@task(name="Get root playlist cache keys")
+def get_root_playlist_cache_keys_task(
+    database: DuckDBPyConnection,
+    playlist_configs: List[PlaylistConfig],
+    track_facts_version: str,
+) -> Dict[str, str]:
+    return root_playlist_cache_keys(
+        playlist_configs,
+        track_facts_version,
+        get_play_stats_version(database),
+    )
+
+
+@task(name="Make root playlists")
+def make_root_playlists_task(
+    database: DuckDBPyConnection, playlist_configs: List[PlaylistConfig]
 ) -> pl.DataFrame:
     logger = get_run_logger()
-    return make_root_playlist(database, playlist_config, logger=logger)
+    logger.info(f"Getting tracks for {len(playlist_configs)} playlists.")
+    return make_root_playlists(database, playlist_configs, logger=logger)
+
+
+@task(name="Evaluate root playlists in memory")
+def evaluate_root_playlists_task(
+    database: DuckDBPyConnection, playlist_configs: List[PlaylistConfig]
+) -> pl.DataFrame:
+    logger = get_run_logger()
+    logger.info("Loading track facts snapshot.")
+    snapshot = load_track_facts_snapshot(database)
+    return evaluate_playlists(snapshot, playlist_configs, logger=logger)
+
+
+@task(name="Save root playlists")
+def save_root_playlists_task(
+    database: DuckDBPyConnection,
+    root_playlists_frame: pl.DataFrame,
+    cache_keys: Dict[str, str],
+    removed: List[str],
+):
+    logger = get_run_logger()
+    database.begin()
+    try:
+        written = save_root_playlists(
+            database, root_playlists_frame, cache_keys, removed
+        )
+        database.commit()
+    except Exception:
+        database.rollback()
+        raise
+    logger.info(
+        f"Replaced {len(cache_keys)} playlists ({written} new rows) and "
+        f"removed {len(removed)}."
+    )
 
 
 @flow(name="Build root playlists")
 def build_root_playlists(
     database_file: str = "spotify.db",
     playlist_config_dir: Path = Path("playlists"),
+    engine: str = "sql",
 ):
     logger = get_run_logger()
 
     database = duckdb.connect(database_file)
+    run_migrations_task(database)
     playlist_configs = get_playlist_configs_task(playlist_config_dir)
+    save_rotation_policies_task(database, playlist_configs)
+    track_facts_version = refresh_track_facts_task(database)
+
+    # Only playlists whose config or inputs changed since they were last
+    # built are evaluated, everything else keeps its rows.
+    cache_keys = get_root_playlist_cache_keys_task(
+        database, playlist_configs, track_facts_version
+    )
+    cached_keys = get_cached_keys(database)
+    stale_configs = [
+        playlist_config
+        for playlist_config in playlist_configs
+        if cached_keys.get(playlist_config.name)
+        != cache_keys[playlist_config.name]
+    ]
+    removed = [name for name in cached_keys if name not in cache_keys]
+    if not stale_configs and not removed:
+        logger.info("All root playlists are up to date.")
+        database.close()
+        return
+    logger.info(
+        f"Rebuilding {len(stale_configs)} of {len(playlist_configs)} "
+        "root playlists."
+    )
 
-    root_playlists: List[pl.DataFrame] = []
-    for playlist_config in playlist_configs:
-        logger.info(f"Getting tracks for {playlist_config.name}")
-        root_playlists.append(
-            make_root_playlist_task(database, playlist_config).with_columns(
-                name=pl.lit(playlist_config.name)
-            )
+    if engine == "numpy":
+        root_playlists_frame = evaluate_root_playlists_task(
+            database, stale_configs
+        )
+    elif engine == "sql":
+        root_playlists_frame = make_root_playlists_task(
+            database, stale_configs
         )
-    root_playlists_frame = pl.concat(root_playlists)
-    logger.info(f"Saving all root playlists to {database}.")
-    save_to_database(
-        database=database,
-        table="root_playlists",
-        data_frame=root_playlists_frame,
-        create_or_replace=True,
+    else:
+        raise ValueError(f"Unknown playlist engine {engine}.")
+    logger.info(f"Saving root playlists to {database}.")
+    save_root_playlists_task(
+        database,
+        root_playlists_frame,
+        {c.name: cache_keys[c.name] for c in stale_configs},
+        removed,
     )
     database.close()
 
@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+from datetime import datetime
+from duckdb import DuckDBPyConnection
+from schema import create_table
+
+
+@dataclass
+class Checkpoint:
+    job: str
+    # Where the job got to - a page offset, batch index, etc.
+    position: int | None
+    # Or the last key the job finished, for jobs that walk sorted keys.
+    cursor: str | None
+    updated_at: datetime
+
+
+def create_checkpoints_table(database: DuckDBPyConnection):
+    create_table(database, "extraction_checkpoints")
+
+
+def get_checkpoint(
+    database: DuckDBPyConnection, job: str
+) -> Checkpoint | None:
+    create_checkpoints_table(database)
+    checkpoint = database.execute(
+        """
+        SELECT job, position, cursor, updated_at
+        FROM extraction_checkpoints
+        WHERE job = ?
+        """,
+        [job],
+    ).fetchone()
+    if checkpoint is None:
+        return None
+    return Checkpoint(*checkpoint)
+
+
+def save_checkpoint(
+    database: DuckDBPyConnection,
+    job: str,
+    position: int | None = None,
+    cursor: str | None = None,
+):
+    """Records progress for job. Call it in the same transaction as the
+    write it's checkpointing so the two can't disagree.
+    """
+    create_checkpoints_table(database)
+    database.execute(
+        """
+        INSERT OR REPLACE INTO extraction_checkpoints
+            (job, position, cursor, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP::TIMESTAMP)
+        """,
+        [job, position, cursor],
+    )
+
+
+def clear_checkpoint(database: DuckDBPyConnection, job: str):
+    create_checkpoints_table(database)
+    database.execute("DELETE FROM extraction_checkpoints WHERE job = ?", [job])
@@ -0,0 +1,212 @@
+import numpy as np
+import polars as pl
+from database import upsert_table
+from duckdb import DuckDBPyConnection
+from schema import create_table
+from spotify_smart_playlists.playlists import AUDIO_FEATURES, ClusterModel
+from typing import List, Tuple
+
+
+def load_feature_vectors(
+    database: DuckDBPyConnection, unassigned_only: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Track ids and their audio features as rows of a matrix, for library
+    tracks with every feature. With unassigned_only, just the tracks that
+    aren't in a cluster yet.
+    """
+    for table in ["library_tracks", "track_audio_features", "track_clusters"]:
+        create_table(database, table)
+    unassigned_filter = (
+        """AND NOT EXISTS (
+            SELECT 1 FROM track_clusters
+            WHERE track_clusters.track_id = track_audio_features.track_id
+        )"""
+        if unassigned_only
+        else ""
+    )
+    # Features are kept for tracks that have left the library, so they're
+    # joined back to it.
+    features = database.sql(
+        f"""
+        SELECT
+            track_audio_features.track_id,
+            {", ".join(AUDIO_FEATURES)}
+        FROM track_audio_features
+        INNER JOIN library_tracks
+            ON track_audio_features.track_id = library_tracks.track_id
+        WHERE
+            {" AND ".join(f"{f} IS NOT NULL" for f in AUDIO_FEATURES)}
+            {unassigned_filter}
+        ORDER BY track_audio_features.track_id
+        """
+    ).pl()
+    return (
+        features.get_column("track_id").to_numpy(),
+        features.select(AUDIO_FEATURES).to_numpy().astype(np.float64),
+    )
+
+
+def load_cluster_model(database: DuckDBPyConnection) -> ClusterModel | None:
+    for table in [
+        "clusters",
+        "cluster_features",
+        "cluster_centroids",
+        "cluster_fits",
+    ]:
+        create_table(database, table)
+    clusters = database.sql(
+        "SELECT cluster, name FROM clusters ORDER BY cluster"
+    ).pl()
+    scaling = database.sql(
+        "SELECT feature, mean, scale FROM cluster_features"
+    ).pl()
+    # A model fit on different features can't place today's vectors.
+    if clusters.is_empty() or set(scaling.get_column("feature")) != set(
+        AUDIO_FEATURES
+    ):
+        return None
+    scaling = {row["feature"]: row for row in scaling.to_dicts()}
+    requested_clusters = database.sql(
+        "SELECT requested_clusters FROM cluster_fits"
+    ).fetchone()
+    centroids = (
+        database.sql("SELECT cluster, feature, value FROM cluster_centroids")
+        .pl()
+        .pivot(
+            values="value",
+            index="cluster",
+            columns="feature",
+            aggregate_function="first",
+        )
+        .sort("cluster")
+    )
+    return ClusterModel(
+        features=AUDIO_FEATURES,
+        mean=np.array([scaling[f]["mean"] for f in AUDIO_FEATURES]),
+        scale=np.array([scaling[f]["scale"] for f in AUDIO_FEATURES]),
+        centroids=centroids.select(AUDIO_FEATURES).to_numpy(),
+        names=clusters.get_column("name").to_list(),
+        # Models saved before fits were recorded got what they asked for.
+        requested_clusters=(
+            requested_clusters[0]
+            if requested_clusters is not None
+            else clusters.shape[0]
+        ),
+    )
+
+
+def save_cluster_model(database: DuckDBPyConnection, model: ClusterModel):
+    clusters = pl.DataFrame(
+        {"cluster": list(range(len(model.names))), "name": model.names},
+        schema={"cluster": pl.Int32, "name": pl.Utf8},
+    )
+    cluster_features = pl.DataFrame(
+        {
+            "feature": model.features,
+            "mean": model.mean.tolist(),
+            "scale": model.scale.tolist(),
+        },
+        schema={"feature": pl.Utf8, "mean": pl.Float64, "scale": pl.Float64},
+    )
+    cluster_centroids = pl.DataFrame(
+        [
+            {"cluster": cluster, "feature": feature, "value": value}
+            for cluster, centroid in enumerate(model.centroids.tolist())
+            for feature, value in zip(model.features, centroid)
+        ],
+        schema={"cluster": pl.Int32, "feature": pl.Utf8, "value": pl.Float64},
+    )
+    upsert_table(database, "clusters", clusters, delete_missing=True)
+    upsert_table(
+        database, "cluster_features", cluster_features, delete_missing=True
+    )
+    upsert_table(
+        database, "cluster_centroids", cluster_centroids, delete_missing=True
+    )
+    database.execute("DELETE FROM cluster_fits")
+    database.execute(
+        """
+        INSERT INTO cluster_fits (fitted_at, requested_clusters)
+        VALUES (CURRENT_TIMESTAMP::TIMESTAMP, ?)
+        """,
+        [model.requested_clusters],
+    )
+
+
+def save_track_clusters(
+    database: DuckDBPyConnection,
+    track_ids: np.ndarray,
+    labels: np.ndarray,
+    replace_all: bool = False,
+) -> int:
+    """Records the cluster of each track. With replace_all these are every
+    track's clusters and any other assignments are dropped.
+    """
+    track_clusters = pl.DataFrame(
+        {"track_id": track_ids.tolist(), "cluster": labels.tolist()},
+        schema={"track_id": pl.Utf8, "cluster": pl.Int32},
+    )
+    return upsert_table(
+        database, "track_clusters", track_clusters, delete_missing=replace_all
+    )
+
+
+def remove_departed_tracks(database: DuckDBPyConnection) -> int:
+    """Drops the cluster assignments of tracks no longer in the library and
+    returns how many went.
+    """
+    return database.execute(
+        """
+        DELETE FROM track_clusters
+        WHERE NOT EXISTS (
+            SELECT 1 FROM library_tracks
+            WHERE library_tracks.track_id = track_clusters.track_id
+        )
+        """
+    ).fetchone()[0]
+
+
+def save_cluster_playlists(
+    database: DuckDBPyConnection, previous_names: List[str]
+) -> int:
+    """Brings the cluster playlists in root_playlists in line with
+    track_clusters, dropping playlists of clusters named in previous_names
+    that no longer exist. Other root playlists are left alone. Returns how
+    many rows were added.
+
+    Doesn't open a transaction, callers should.
+    """
+    create_table(database, "root_playlists")
+    cluster_playlists = database.sql(
+        """
+        SELECT track_clusters.track_id, clusters.name
+        FROM track_clusters
+        INNER JOIN clusters
+            ON track_clusters.cluster = clusters.cluster
+        """
+    ).pl()
+    cluster_names = pl.DataFrame(  # noqa
+        {
+            "name": list(
+                {
+                    *previous_names,
+                    *cluster_playlists.get_column("name").unique(),
+                }
+            )
+        },
+        schema={"name": pl.Utf8},
+    )
+    database.execute(
+        """
+        DELETE FROM root_playlists
+        WHERE
+            name IN (SELECT name FROM cluster_names) AND
+            NOT EXISTS (
+                SELECT 1 FROM cluster_playlists
+                WHERE
+                    cluster_playlists.name = root_playlists.name AND
+                    cluster_playlists.track_id = root_playlists.track_id
+            )
+        """
+    )
+    return upsert_table(database, "root_playlists", cluster_playlists)
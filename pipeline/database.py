@@ -1,5 +1,6 @@
 from duckdb import DuckDBPyConnection
 from prefect import task, get_run_logger
+from schema import create_table, get_table_schema
 import polars as pl
 
 
@@ -16,7 +17,9 @@ def save_to_database(
     database: DuckDBPyConnection,
     table: str,
     data_frame: pl.DataFrame,
-    create_or_replace: bool,
+    create_or_replace: bool = False,
+    upsert: bool = False,
+    delete_missing: bool = False,
 ):
     logger = get_run_logger()
     logger.info(
@@ -25,7 +28,18 @@ def save_to_database(
     if data_frame.is_empty():
         logger.warning("Data frame is empty, skipping DB operation.")
         return
-    if create_or_replace:
+    if upsert:
+        database.begin()
+        try:
+            changed = upsert_table(
+                database, table, data_frame, delete_missing=delete_missing
+            )
+            database.commit()
+        except Exception:
+            database.rollback()
+            raise
+        logger.info(f"Inserted or updated {changed} rows in {table}.")
+    elif create_or_replace:
         database.execute(
             f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM data_frame"
         )
@@ -34,3 +48,97 @@ def save_to_database(
         database.execute(
             f"INSERT INTO {table} ({columns}) SELECT * FROM data_frame"
         )
+
+
+def upsert_table(
+    database: DuckDBPyConnection,
+    table: str,
+    source: str | pl.DataFrame,
+    delete_missing: bool = False,
+    scope: str | None = None,
+) -> int:
+    """Merges source - a frame or the name of another table - into table on
+    its declared primary key and returns how many rows were inserted or
+    updated. Rows that are already identical aren't touched, so replaying
+    the same source is a no-op.
+
+    With delete_missing, rows whose key isn't in source are deleted too. If
+    scope names a column, that's limited to rows sharing a scope value with
+    source (e.g. the artists of just the tracks being merged).
+
+    This doesn't open a transaction so callers can group it with other
+    writes.
+    """
+    schema = get_table_schema(table)
+    create_table(database, table)
+    if isinstance(source, pl.DataFrame):
+        source_frame = source  # noqa
+        source = "source_frame"
+    columns = ", ".join(schema.columns)
+    primary_key = ", ".join(schema.primary_key)
+
+    if delete_missing:
+        key_matches = " AND ".join(
+            f"{table}.{column} = source.{column}"
+            for column in schema.primary_key
+        )
+        scope_filter = (
+            f"{scope} IN (SELECT {scope} FROM {source}) AND"
+            if scope is not None
+            else ""
+        )
+        database.execute(
+            f"""
+            DELETE FROM {table}
+            WHERE {scope_filter} NOT EXISTS (
+                SELECT 1 FROM {source} AS source WHERE {key_matches}
+            )
+            """
+        )
+
+    if schema.value_columns:
+        updates = ", ".join(
+            f"{column} = excluded.{column}" for column in schema.value_columns
+        )
+        current_values = ", ".join(
+            f"{table}.{column}" for column in schema.value_columns
+        )
+        new_values = ", ".join(
+            f"excluded.{column}" for column in schema.value_columns
+        )
+        on_conflict = (
+            f"DO UPDATE SET {updates} "
+            f"WHERE ({current_values}) IS DISTINCT FROM ({new_values})"
+        )
+    else:
+        on_conflict = "DO NOTHING"
+    # A key can only be written once per statement, and retried or
+    # re-paged pulls can repeat one.
+    return database.execute(
+        f"""
+        INSERT INTO {table} ({columns})
+        SELECT DISTINCT ON ({primary_key}) {columns} FROM {source}
+        ON CONFLICT ({primary_key}) {on_conflict}
+        """
+    ).fetchone()[0]
+
+
+def append_record_batches(
+    database: DuckDBPyConnection, table: str, data_frame: pl.DataFrame
+):
+    """Appends a frame to table as Arrow record batches, creating the table
+    from the frame's schema first if it doesn't exist yet.
+
+    This isn't a task so it can be called once per chunk from inside the
+    streaming tasks.
+    """
+    empty_frame = data_frame.head(0)  # noqa
+    database.execute(
+        f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM empty_frame"
+    )
+    record_batches = data_frame.to_arrow().to_reader()  # noqa
+    columns = ",".join(data_frame.columns)
+    database.execute(
+        f"INSERT INTO {table} ({columns}) "
+        f"SELECT {columns} FROM record_batches"
+    )
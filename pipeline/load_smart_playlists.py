@@ -3,16 +3,26 @@ from prefect import task, flow, get_run_logger
 import duckdb
 import polars as pl
 from duckdb import DuckDBPyConnection
-from typing import Optional, List
+from typing import Dict, Optional, List
 from spotify_smart_playlists.playlists import (
-    get_playlist_from_spotify,
+    get_playlist_index,
     create_playlist_on_spotify,
     load_playlist_to_spotify,
-    get_tracks_for_playlist,
+    get_tracks_for_playlists,
+    RotationConfig,
     get_recommended_tracks,
+    AudioFeatureIndex,
+    load_audio_feature_index,
+    recommend_tracks,
+)
+from spotify_smart_playlists.helpers import (
+    SpotifyCredentials,
+    spotify_auth,
+    RateLimitedSpotify,
 )
-from spotify_smart_playlists.helpers import SpotifyCredentials, spotify_auth
 import spotipy
+from migrations import run_migrations_task
+from rotation_policies import get_rotation_policies
 
 
 @task(name="Get root playlist names")
@@ -27,14 +37,23 @@ def get_root_playlist_names_task(database: DuckDBPyConnection) -> List[str]:
     )
 
 
-@task(name="Get tracks for playlist")
-def get_tracks_for_playlist_task(
-    database: DuckDBPyConnection, playlist_name: str, num_tracks: int
-) -> List[str]:
+@task(name="Get rotation policies")
+def get_rotation_policies_task(
+    database: DuckDBPyConnection,
+) -> Dict[str, RotationConfig]:
+    return get_rotation_policies(database)
+
+
+@task(name="Get playlist rotations")
+def get_playlist_rotations_task(
+    database: DuckDBPyConnection,
+    policies: Dict[str, RotationConfig],
+    num_tracks: int,
+) -> Dict[str, List[str]]:
     logger = get_run_logger()
-    logger.info(f"Getting tracks for playlist {playlist_name}.")
-    return get_tracks_for_playlist(
-        database, playlist_name, num_tracks=num_tracks
+    logger.info("Getting tracks for all playlists.")
+    return get_tracks_for_playlists(
+        database, policies=policies, num_tracks=num_tracks
     )
 
 
@@ -48,12 +67,37 @@ def get_recommended_tracks_task(
     )
 
 
-@task(name="Get playlist from Spotify")
-def get_playlist_from_spotify_task(
-    spotify: spotipy.Spotify, playlist_name: str
-) -> Optional[str]:
+@task(name="Load audio feature index")
+def load_audio_feature_index_task(
+    database: DuckDBPyConnection,
+) -> AudioFeatureIndex:
+    logger = get_run_logger()
+    index = load_audio_feature_index(database)
+    logger.info(f"Indexed audio features for {len(index)} tracks.")
+    return index
+
+
+@task(name="Recommend similar tracks")
+def recommend_tracks_task(
+    index: AudioFeatureIndex,
+    playlist_tracks: List[str],
+    tracks_to_pull: int,
+    cooldown_days: int,
+) -> List[str]:
+    logger = get_run_logger()
+    return recommend_tracks(
+        index,
+        playlist_tracks,
+        tracks_to_pull,
+        cooldown_days=cooldown_days,
+        logger=logger,
+    )
+
+
+@task(name="Get playlist index from Spotify")
+def get_playlist_index_task(spotify: spotipy.Spotify) -> Dict[str, str]:
     logger = get_run_logger()
-    return get_playlist_from_spotify(spotify, playlist_name, logger=logger)
+    return get_playlist_index(spotify, logger=logger)
 
 
 @task(name="Create playlist on Spotify")
@@ -74,23 +118,36 @@ def load_playlist_to_spotify_task(
     )
 
 
-@task(name="Validate playlist tracks")
-def validate_playlist_tracks_task(
-    database: DuckDBPyConnection, playlist_tracks: List[str]
+@task(name="Validate playlist rotations")
+def validate_playlist_rotations_task(
+    database: DuckDBPyConnection,
+    rotations: Dict[str, List[str]],
+    policies: Dict[str, RotationConfig],
 ):
     logger = get_run_logger()
     logger.info("Checking playlist tracks to ensure they are valid.")
-    playlist_tracks_frame = pl.DataFrame().with_columns(  # noqa
-        track_id=pl.Series(playlist_tracks)
+    rotation_tracks = pl.DataFrame(  # noqa
+        [
+            {
+                "track_id": track_id,
+                "cooldown_days": policies.get(
+                    name, RotationConfig()
+                ).cooldown_days,
+            }
+            for name, track_ids in rotations.items()
+            for track_id in track_ids
+        ],
+        schema={"track_id": pl.Utf8, "cooldown_days": pl.Int32},
     )
     invalid_tracks = database.sql(
         """
-            SELECT ph.track_id
-            FROM play_history AS ph
-            INNER JOIN playlist_tracks_frame AS ptf ON
-            ph.track_id = ptf.track_id
-            GROUP BY ph.track_id
-            HAVING DATE_DIFF('day', MAX(ph.played_at), CURRENT_DATE) <= 14
+            SELECT tlp.track_id
+            FROM track_last_played AS tlp
+            INNER JOIN rotation_tracks AS rt ON
+            tlp.track_id = rt.track_id
+            WHERE
+                DATE_DIFF('day', tlp.last_played_at, CURRENT_DATE)
+                    <= rt.cooldown_days
         """
     ).pl()
     assert invalid_tracks.is_empty()
@@ -104,8 +161,11 @@ def load_smart_playlists(
     client_secret: Optional[str] = None,
     redirect_uri: Optional[str] = None,
     num_tracks: int = 50,
+    recommender: str = "local",
 ):
     logger = get_run_logger()
+    if recommender not in ("local", "spotify"):
+        raise ValueError(f"Unknown recommender {recommender}.")
     credentials: SpotifyCredentials | None = None
     if client_id and client_secret and redirect_uri:
         logger.info("Explicitly initializing credentials.")
@@ -117,7 +177,7 @@ def load_smart_playlists(
     else:
         logger.info("Insufficient explicit credentials, using environment.")
 
-    spotify = spotipy.Spotify(
+    spotify = RateLimitedSpotify(
         client_credentials_manager=spotify_auth(
             database_file, credentials=credentials, cache_key=cache_fernet_key
         )
@@ -127,26 +187,47 @@ def load_smart_playlists(
 
     database = duckdb.connect(database_file)
     logger.info("Connected to database.")
+    run_migrations_task(database)
 
     root_playlist_names = get_root_playlist_names_task(database)
 
+    policies = get_rotation_policies_task(database)
+    rotations = get_playlist_rotations_task(database, policies, num_tracks)
+    validate_playlist_rotations_task(database, rotations, policies)
+    if recommender == "local":
+        audio_feature_index = load_audio_feature_index_task(database)
+    playlist_index = get_playlist_index_task(spotify)
+
     for root_playlist_name in root_playlist_names:
-        tracks = get_tracks_for_playlist_task(
-            database, root_playlist_name, num_tracks=50
-        )
-        validate_playlist_tracks_task(database, tracks)
+        if root_playlist_name not in rotations:
+            # Recommendations need at least one seed track.
+            logger.warning(
+                f"No tracks to rotate into {root_playlist_name}, skipping."
+            )
+            continue
+        tracks = rotations[root_playlist_name]
         num_recommended_tracks = num_tracks + 5 - len(tracks)
-        tracks += get_recommended_tracks_task(
-            spotify, tracks, num_recommended_tracks
-        )
-        playlist_id = get_playlist_from_spotify_task(
-            spotify, root_playlist_name
-        )
+        # Seeds (the rotation itself) are never recommended back.
+        if recommender == "local":
+            # Nor are tracks still cooling down under the playlist's policy.
+            policy = policies.get(root_playlist_name, RotationConfig())
+            tracks += recommend_tracks_task(
+                audio_feature_index,
+                tracks,
+                num_recommended_tracks,
+                policy.cooldown_days,
+            )
+        else:
+            tracks += get_recommended_tracks_task(
+                spotify, tracks, num_recommended_tracks
+            )
+        playlist_id = playlist_index.get(root_playlist_name)
         if playlist_id is None:
             playlist_id = create_playlist_on_spotify_task(
                 spotify,
                 root_playlist_name,
             )
+            playlist_index[root_playlist_name] = playlist_id
         load_playlist_to_spotify_task(spotify, playlist_id, tracks)
         logger.info(f"Loaded new tracks for {root_playlist_name}.")
     database.close()
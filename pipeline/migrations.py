@@ -0,0 +1,205 @@
+import loguru
+from dataclasses import dataclass
+from duckdb import DuckDBPyConnection
+from prefect import task, get_run_logger
+from schema import (
+    TABLES,
+    create_table,
+    deduplicate_table,
+    has_primary_key,
+)
+from typing import Callable, List
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[DuckDBPyConnection], None]
+
+
+def _table_exists(database: DuckDBPyConnection, table: str) -> bool:
+    tables = {x[0] for x in database.sql("SHOW TABLES").fetchall()}
+    return table in tables
+
+
+def _column_type(
+    database: DuckDBPyConnection, table: str, column: str
+) -> str | None:
+    column_type = database.execute(
+        """
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = ? AND column_name = ?
+        """,
+        [table, column],
+    ).fetchone()
+    return column_type[0] if column_type else None
+
+
+def strip_play_history_timezone(database: DuckDBPyConnection):
+    # Early play_history tables stored played_at with a time zone, and the
+    # rest of the pipeline compares it to naive UTC timestamps.
+    played_at_type = _column_type(database, "play_history", "played_at")
+    if played_at_type != "TIMESTAMP WITH TIME ZONE":
+        return
+    # Columns can't change type while an index depends on them.
+    database.execute("DROP INDEX IF EXISTS play_history_primary_key")
+    database.execute(
+        """
+        ALTER TABLE play_history
+        ALTER played_at SET DATA TYPE TIMESTAMP
+        USING (played_at AT TIME ZONE 'UTC')
+        """
+    )
+
+
+def drop_old_playlist_tables(database: DuckDBPyConnection):
+    # Per-playlist tables from before root_playlists held all of them, and
+    # the scratch copy from the old time zone fix.
+    for table in [
+        "all-high-energy",
+        "all_synthwave",
+        "angry-instrumental",
+        "calm-instrumentals",
+        "hip-hop",
+        "play_history_tz_corrected",
+        "synthwave_flow",
+        "synthwave_speed",
+        "wu-tang",
+    ]:
+        database.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+
+def _unkeyed_tables(database: DuckDBPyConnection) -> List[str]:
+    return [
+        table
+        for table in TABLES
+        if _table_exists(database, table)
+        and not has_primary_key(database, table)
+    ]
+
+
+def deduplicate_tables(database: DuckDBPyConnection):
+    # Tables made with CREATE TABLE AS have no key, and blind inserts from
+    # retried runs left duplicates behind in some of them.
+    for table in _unkeyed_tables(database):
+        deduplicate_table(database, table)
+
+
+def add_primary_keys(database: DuckDBPyConnection):
+    for table in _unkeyed_tables(database):
+        create_table(database, table)
+
+
+def backfill_track_last_played(database: DuckDBPyConnection):
+    create_table(database, "track_last_played")
+    if not _table_exists(database, "play_history"):
+        return
+    database.execute(
+        """
+        INSERT OR REPLACE INTO track_last_played
+            (track_id, last_played_at, play_count)
+        SELECT track_id, MAX(played_at), COUNT(*)
+        FROM play_history
+        GROUP BY track_id
+        """
+    )
+
+
+def backfill_track_daily_plays(database: DuckDBPyConnection):
+    create_table(database, "track_daily_plays")
+    if not _table_exists(database, "play_history"):
+        return
+    database.execute(
+        """
+        INSERT INTO track_daily_plays (track_id, play_date, play_count)
+        SELECT track_id, played_at::DATE, COUNT(*)
+        FROM play_history
+        GROUP BY track_id, played_at::DATE
+        ON CONFLICT (track_id, play_date) DO UPDATE SET
+            play_count = excluded.play_count
+        """
+    )
+
+
+def track_root_playlist_cache(database: DuckDBPyConnection):
+    # Playlists built before the cache existed get an empty key, so they're
+    # rebuilt on the next run, and dropped if their config is gone.
+    create_table(database, "root_playlist_cache")
+    if not _table_exists(database, "root_playlists"):
+        return
+    database.execute(
+        """
+        INSERT OR IGNORE INTO root_playlist_cache (name, cache_key, built_at)
+        SELECT DISTINCT name, NULL, NULL FROM root_playlists
+        """
+    )
+
+
+# Append only - each migration runs once, in version order, and is recorded
+# in schema_version. They also check the state they expect, so a database
+# that never had the problem passes straight through.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "strip_play_history_timezone", strip_play_history_timezone),
+    Migration(2, "drop_old_playlist_tables", drop_old_playlist_tables),
+    Migration(3, "deduplicate_tables", deduplicate_tables),
+    Migration(4, "add_primary_keys", add_primary_keys),
+    Migration(5, "backfill_track_last_played", backfill_track_last_played),
+    Migration(6, "backfill_track_daily_plays", backfill_track_daily_plays),
+    Migration(7, "track_root_playlist_cache", track_root_playlist_cache),
+]
+
+
+def create_schema_version_table(database: DuckDBPyConnection):
+    database.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR,
+            applied_at TIMESTAMP
+        )
+        """
+    )
+
+
+def get_schema_version(database: DuckDBPyConnection) -> int:
+    create_schema_version_table(database)
+    return database.sql(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_version"
+    ).fetchone()[0]
+
+
+def run_migrations(database: DuckDBPyConnection, logger=loguru.logger) -> int:
+    """Applies any migrations newer than the database's schema version, each
+    in its own transaction with its schema_version row. Returns the number
+    applied.
+    """
+    schema_version = get_schema_version(database)
+    pending = [m for m in MIGRATIONS if m.version > schema_version]
+    for migration in pending:
+        logger.info(
+            f"Applying migration {migration.version}: {migration.name}."
+        )
+        database.begin()
+        try:
+            migration.apply(database)
+            database.execute(
+                """
+                INSERT INTO schema_version (version, name, applied_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP::TIMESTAMP)
+                """,
+                [migration.version, migration.name],
+            )
+            database.commit()
+        except Exception:
+            database.rollback()
+            raise
+    return len(pending)
+
+
+@task(name="Run migrations")
+def run_migrations_task(database: DuckDBPyConnection):
+    logger = get_run_logger()
+    applied = run_migrations(database, logger=logger)
+    if not applied:
+        logger.info("Database schema is up to date.")
@@ -0,0 +1,60 @@
+import polars as pl
+from duckdb import DuckDBPyConnection
+from schema import create_table
+
+
+def record_plays(database: DuckDBPyConnection, plays: pl.DataFrame) -> int:
+    """Appends the plays that aren't in play_history yet and folds them into
+    track_last_played and track_daily_plays, returning how many were new.
+
+    Every write to play_history should go through here so the summaries can't
+    drift from it. Doesn't open a transaction, callers should.
+    """
+    create_table(database, "play_history")
+    create_table(database, "track_last_played")
+    create_table(database, "track_daily_plays")
+    # Only plays that weren't already saved count, so replaying a poll (or
+    # a retried run) leaves the play counts alone.
+    new_plays = database.execute(  # noqa
+        """
+        SELECT DISTINCT track_id, played_at FROM plays
+        WHERE NOT EXISTS (
+            SELECT 1 FROM play_history AS ph
+            WHERE
+                ph.track_id = plays.track_id AND
+                ph.played_at = plays.played_at
+        )
+        """
+    ).pl()
+    if new_plays.is_empty():
+        return 0
+    database.execute(
+        """
+        INSERT INTO play_history (track_id, played_at)
+        SELECT track_id, played_at FROM new_plays
+        """
+    )
+    database.execute(
+        """
+        INSERT INTO track_last_played (track_id, last_played_at, play_count)
+        SELECT track_id, MAX(played_at), COUNT(*)
+        FROM new_plays
+        GROUP BY track_id
+        ON CONFLICT (track_id) DO UPDATE SET
+            last_played_at = GREATEST(
+                track_last_played.last_played_at, excluded.last_played_at
+            ),
+            play_count = track_last_played.play_count + excluded.play_count
+        """
+    )
+    database.execute(
+        """
+        INSERT INTO track_daily_plays (track_id, play_date, play_count)
+        SELECT track_id, played_at::DATE, COUNT(*)
+        FROM new_plays
+        GROUP BY track_id, played_at::DATE
+        ON CONFLICT (track_id, play_date) DO UPDATE SET
+            play_count = track_daily_plays.play_count + excluded.play_count
+        """
+    )
+    return new_plays.shape[0]
@@ -1,21 +1,180 @@
 import typer
 from prefect import task, flow, get_run_logger
-from spotify_smart_playlists.extract import pull_library_tracks
-from spotify_smart_playlists.helpers import SpotifyCredentials, spotify_auth
-from database import save_to_database
+from spotify_smart_playlists.extract import (
+    pull_library_tracks,
+    iter_library_tracks,
+    get_library_track_count,
+)
+from spotify_smart_playlists.helpers import (
+    SpotifyCredentials,
+    spotify_auth,
+    RateLimitedSpotify,
+)
+from database import (
+    save_to_database,
+    table_exists,
+    append_record_batches,
+    upsert_table,
+)
+from checkpoints import get_checkpoint, save_checkpoint, clear_checkpoint
+from migrations import run_migrations_task
 import spotipy
 import polars as pl
+from datetime import datetime
+from duckdb import DuckDBPyConnection
 from typing import Tuple, Optional
 import duckdb
 
+LIBRARY_TRACKS_JOB = "library_tracks"
+
 
 @task(name="Pull library tracks")
 def pull_library_tracks_task(
     spotify: spotipy.Spotify,
+    added_since: datetime | None = None,
+    max_concurrency: int = 1,
 ) -> Tuple[pl.DataFrame, pl.DataFrame]:
     logger = get_run_logger()
     logger.info("Pulling tracks and track artists.")
-    return pull_library_tracks(spotify, logger=logger)
+    return pull_library_tracks(
+        spotify,
+        logger=logger,
+        added_since=added_since,
+        max_concurrency=max_concurrency,
+    )
+
+
+@task(name="Get latest date_added value")
+def get_latest_date_added_task(database: DuckDBPyConnection) -> datetime:
+    logger = get_run_logger()
+    logger.info("Getting latest date_added value from library_tracks table.")
+    return database.sql(
+        "SELECT MAX(date_added) FROM library_tracks"
+    ).fetchone()[0]
+
+
+@task(name="Check library track count")
+def library_track_count_matches_task(
+    spotify: spotipy.Spotify, database: DuckDBPyConnection
+) -> bool:
+    logger = get_run_logger()
+    spotify_count = get_library_track_count(spotify)
+    database_count = database.sql(
+        "SELECT COUNT(DISTINCT track_id) FROM library_tracks"
+    ).fetchone()[0]
+    logger.info(
+        f"Spotify has {spotify_count} library tracks, "
+        f"database has {database_count}."
+    )
+    return spotify_count == database_count
+
+
+@task(name="Merge library tracks")
+def merge_library_tracks_task(
+    database: DuckDBPyConnection,
+    new_library_tracks: pl.DataFrame,
+    new_track_artists: pl.DataFrame,
+):
+    logger = get_run_logger()
+    logger.info(
+        f"Merging {new_library_tracks.shape[0]} library tracks and "
+        f"{new_track_artists.shape[0]} track artists."
+    )
+    if new_library_tracks.is_empty():
+        logger.info("No new library tracks to merge.")
+        return
+    database.begin()
+    try:
+        upsert_table(database, "library_tracks", new_library_tracks)
+        # Re-saved tracks bring their full artist list, so any other artists
+        # stored for those tracks are stale.
+        upsert_table(
+            database,
+            "track_artists",
+            new_track_artists,
+            delete_missing=True,
+            scope="track_id",
+        )
+        database.commit()
+    except Exception:
+        database.rollback()
+        raise
+
+
+@task(name="Stream library tracks")
+def stream_library_tracks_task(
+    spotify: spotipy.Spotify,
+    database: DuckDBPyConnection,
+    chunk_size: int,
+    max_concurrency: int,
+):
+    logger = get_run_logger()
+    checkpoint = get_checkpoint(database, LIBRARY_TRACKS_JOB)
+    offset = 0
+    if (
+        checkpoint is not None
+        and checkpoint.position is not None
+        and table_exists.fn(database, "library_tracks_staging")
+        and table_exists.fn(database, "track_artists_staging")
+    ):
+        offset = checkpoint.position
+        logger.info(
+            f"Resuming library pull at offset {offset} from checkpoint "
+            f"saved {checkpoint.updated_at}."
+        )
+    else:
+        database.execute("DROP TABLE IF EXISTS library_tracks_staging")
+        database.execute("DROP TABLE IF EXISTS track_artists_staging")
+    # Each chunk is committed to the staging tables along with its
+    # checkpoint as it arrives, so memory stays flat and a failed run picks
+    # up where it stopped.
+    for chunk in iter_library_tracks(
+        spotify,
+        logger=logger,
+        chunk_size=chunk_size,
+        offset=offset,
+        max_concurrency=max_concurrency,
+    ):
+        database.begin()
+        try:
+            append_record_batches(
+                database, "library_tracks_staging", chunk.library_tracks
+            )
+            append_record_batches(
+                database, "track_artists_staging", chunk.track_artists
+            )
+            save_checkpoint(
+                database, LIBRARY_TRACKS_JOB, position=chunk.next_offset
+            )
+            database.commit()
+        except Exception:
+            database.rollback()
+            raise
+
+    logger.info("Library pulled, merging staging into library tables.")
+    database.begin()
+    try:
+        # Only rows that changed since the last full pull get written, and
+        # anything no longer in the library is removed.
+        upsert_table(
+            database,
+            "library_tracks",
+            "library_tracks_staging",
+            delete_missing=True,
+        )
+        upsert_table(
+            database,
+            "track_artists",
+            "track_artists_staging",
+            delete_missing=True,
+        )
+        database.execute("DROP TABLE library_tracks_staging")
+        database.execute("DROP TABLE track_artists_staging")
+        clear_checkpoint(database, LIBRARY_TRACKS_JOB)
+        database.commit()
+    except Exception:
+        database.rollback()
+        raise
 
 
 @flow(name="Pull library")
@@ -25,6 +184,10 @@ def pull_library(
     client_id: Optional[str] = None,
     client_secret: Optional[str] = None,
     redirect_uri: Optional[str] = None,
+    full_refresh: bool = False,
+    max_concurrency: int = 4,
+    stream: bool = True,
+    chunk_size: int = 1000,
 ):
     logger = get_run_logger()
     credentials: SpotifyCredentials | None = None
@@ -38,28 +201,60 @@ def pull_library(
     else:
         logger.info("Insufficient explicit credentials, using environment.")
 
-    spotify = spotipy.Spotify(
+    spotify = RateLimitedSpotify(
         client_credentials_manager=spotify_auth(
             database_file, credentials=credentials, cache_key=cache_fernet_key
         )
     )
 
     logger.info("Connected to Spotify.")
-    library_tracks, track_artists = pull_library_tracks_task(spotify)
     database = duckdb.connect(database_file)
+    run_migrations_task(database)
 
-    save_to_database(
-        database=database,
-        table="library_tracks",
-        data_frame=library_tracks,
-        create_or_replace=True,
-    )
-    save_to_database(
-        database=database,
-        table="track_artists",
-        data_frame=track_artists,
-        create_or_replace=True,
+    library_exists = table_exists(database, "library_tracks") and table_exists(
+        database, "track_artists"
     )
+    if stream and get_checkpoint(database, LIBRARY_TRACKS_JOB) is not None:
+        logger.info("Found an unfinished library pull, resuming it.")
+        full_refresh = True
+    if library_exists and not full_refresh:
+        latest_date_added = get_latest_date_added_task(database)
+        logger.info(f"Latest date_added: {latest_date_added}.")
+        new_library_tracks, new_track_artists = pull_library_tracks_task(
+            spotify, added_since=latest_date_added
+        )
+        merge_library_tracks_task(
+            database, new_library_tracks, new_track_artists
+        )
+        # Additions are covered by the merge, so a count mismatch means
+        # tracks were removed from the library (or older tracks were
+        # re-added). Either way the only way to find them is a full pull.
+        full_refresh = not library_track_count_matches_task(spotify, database)
+        if full_refresh:
+            logger.info("Library counts differ, falling back to full pull.")
+
+    if (full_refresh or not library_exists) and stream:
+        stream_library_tracks_task(
+            spotify, database, chunk_size, max_concurrency
+        )
+    elif full_refresh or not library_exists:
+        library_tracks, track_artists = pull_library_tracks_task(
+            spotify, max_concurrency=max_concurrency
+        )
+        save_to_database(
+            database=database,
+            table="library_tracks",
+            data_frame=library_tracks,
+            upsert=True,
+            delete_missing=True,
+        )
+        save_to_database(
+            database=database,
+            table="track_artists",
+            data_frame=track_artists,
+            upsert=True,
+            delete_missing=True,
+        )
 
     database.close()
     logger.info("Done updating library.")
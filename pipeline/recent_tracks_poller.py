@@ -0,0 +1,163 @@
+import time
+import typer
+import duckdb
+import polars as pl
+import requests
+from loguru import logger
+from datetime import datetime
+from duckdb import DuckDBPyConnection
+from spotipy import SpotifyException
+from typing import Callable, Optional
+from spotify_smart_playlists.extract import pull_recent_tracks
+from spotify_smart_playlists.helpers import (
+    AdaptivePollInterval,
+    SpotifyCredentials,
+    spotify_auth,
+    RateLimitedSpotify,
+)
+from plays import record_plays
+from migrations import run_migrations
+
+
+def get_latest_played_at(database: DuckDBPyConnection) -> datetime | None:
+    tables = {x[0] for x in database.sql("SHOW TABLES").fetchall()}
+    if "play_history" not in tables:
+        return None
+    return database.sql("SELECT MAX(played_at) FROM play_history").fetchone()[
+        0
+    ]
+
+
+def save_recent_tracks(
+    database: DuckDBPyConnection, recent_tracks: pl.DataFrame
+):
+    database.begin()
+    try:
+        record_plays(database, recent_tracks)
+        database.commit()
+    except Exception:
+        database.rollback()
+        raise
+
+
+def poll_recent_tracks(
+    spotify: RateLimitedSpotify,
+    database: DuckDBPyConnection,
+    poll_interval: AdaptivePollInterval,
+    sync: Callable[[], None] | None = None,
+    sync_interval: float = 3600.0,
+    max_polls: int | None = None,
+    logger=logger,
+):
+    """Polls recent tracks into play_history until interrupted, keeping the
+    client, token and connection open between polls.
+
+    If sync is given it's called (after a checkpoint, so the file on disk
+    is complete) at most once per sync_interval when there are new plays,
+    and once more on the way out.
+    """
+    run_migrations(database, logger=logger)
+    latest_played_at = get_latest_played_at(database)
+    logger.info(f"Latest played_at: {latest_played_at}.")
+    last_poll: float | None = None
+    last_sync = time.monotonic()
+    unsynced_plays = 0
+    polls = 0
+
+    def sync_database():
+        nonlocal last_sync, unsynced_plays
+        logger.info(f"Syncing {unsynced_plays} new plays to remote storage.")
+        database.execute("CHECKPOINT")
+        sync()
+        last_sync = time.monotonic()
+        unsynced_plays = 0
+
+    try:
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            try:
+                recent_tracks = pull_recent_tracks(
+                    spotify, latest_played_at, logger=logger
+                )
+            except (SpotifyException, requests.RequestException):
+                # Keep the daemon up through outages, the cursor means
+                # nothing is lost as long as the window doesn't overflow.
+                logger.exception("Recent tracks poll failed.")
+                time.sleep(poll_interval.interval)
+                continue
+            now = time.monotonic()
+            # The first poll's plays piled up over however long the poller
+            # was down, not over this round trip, so they give no rate.
+            elapsed = now - last_poll if last_poll is not None else 0.0
+            last_poll = now
+
+            plays = 0
+            if recent_tracks is not None:
+                save_recent_tracks(database, recent_tracks)
+                latest_played_at = recent_tracks["played_at"].max()
+                plays = recent_tracks.shape[0]
+                unsynced_plays += plays
+            if plays >= poll_interval.window:
+                logger.warning(
+                    f"Poll returned {plays} plays, a full window. "
+                    "Some plays may have been missed."
+                )
+
+            interval = poll_interval.observe(plays, elapsed)
+            if sync and unsynced_plays and now - last_sync >= sync_interval:
+                sync_database()
+            logger.info(f"Next poll in {interval:.0f}s.")
+            if max_polls is None or polls < max_polls:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info("Stopping poller.")
+    finally:
+        if sync and unsynced_plays:
+            sync_database()
+
+
+def main(
+    database_file: str = "spotify.db",
+    cache_fernet_key: Optional[str] = None,
+    client_id: Optional[str] = None,
+    client_secret: Optional[str] = None,
+    redirect_uri: Optional[str] = None,
+    min_interval: float = 60.0,
+    max_interval: float = 1800.0,
+    max_polls: Optional[int] = None,
+):
+    credentials: SpotifyCredentials | None = None
+    if client_id and client_secret and redirect_uri:
+        logger.info("Explicitly initializing credentials.")
+        credentials = SpotifyCredentials(
+            client_id=client_id,
+            client_secret=client_secret,
+            redirect_uri=redirect_uri,
+        )
+    else:
+        logger.info("Insufficient explicit credentials, using environment.")
+
+    spotify = RateLimitedSpotify(
+        client_credentials_manager=spotify_auth(
+            database_file, credentials=credentials, cache_key=cache_fernet_key
+        )
+    )
+    logger.info("Connected to spotify.")
+
+    database = duckdb.connect(database_file)
+    logger.info("Connected to database.")
+    try:
+        poll_recent_tracks(
+            spotify,
+            database,
+            AdaptivePollInterval(
+                min_interval=min_interval, max_interval=max_interval
+            ),
+            max_polls=max_polls,
+        )
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,91 @@
+import typer
+import duckdb
+from prefect import flow, get_run_logger
+from prefect.blocks.system import Secret
+from prefect_gcp import GcpCredentials, GcsBucket
+from prefect.filesystems import RemoteFileSystem
+from pathlib import Path
+from typing import Optional
+from spotify_smart_playlists.helpers import (
+    AdaptivePollInterval,
+    SpotifyCredentials,
+    spotify_auth,
+    RateLimitedSpotify,
+)
+from recent_tracks_poller import poll_recent_tracks
+
+
+@flow(name="Recent tracks poller (Docker)")
+def main(
+    data_dir: Path = Path("data"),
+    min_interval: float = 60.0,
+    max_interval: float = 1800.0,
+    sync_interval: float = 3600.0,
+    max_polls: Optional[int] = None,
+):
+    """Resident version of update_recent_tracks_docker. Secrets and the
+    database are fetched once at startup, and the database is only pushed
+    back to MinIO and GCS every sync_interval instead of on every poll.
+    """
+    logger = get_run_logger()
+    logger.info("Fetching secrets.")
+    cache_fernet_key = Secret.load("spotify-cache-fernet-key").get()
+    client_id = Secret.load("spotify-client-id").get()
+    client_secret = Secret.load("spotify-client-secret").get()
+    redirect_uri = Secret.load("spotify-redirect-uri").get()
+
+    database_file = data_dir.absolute() / "spotify.db"
+    logger.info(f"Downloading database to {database_file}")
+    minio_local_dataset_storage = RemoteFileSystem.load(
+        "minio-local-dataset-storage"
+    )
+    minio_local_dataset_storage.get_directory(
+        from_path="spotify/data", local_path=str(data_dir)
+    )
+
+    logger.info("Fetching credentials.")
+    gcp_credentials = GcpCredentials.load("prefect-gcs-rw")
+    spotify_bucket = GcsBucket(
+        bucket="trenner-datasets", gcp_credentials=gcp_credentials
+    )
+
+    def sync():
+        minio_local_dataset_storage.put_directory(
+            local_path=str(data_dir), to_path="spotify/data"
+        )
+        spotify_bucket.upload_from_path(database_file, "spotify/spotify.db")
+
+    spotify = RateLimitedSpotify(
+        client_credentials_manager=spotify_auth(
+            str(database_file),
+            credentials=SpotifyCredentials(
+                client_id=client_id,
+                client_secret=client_secret,
+                redirect_uri=redirect_uri,
+            ),
+            cache_key=cache_fernet_key,
+        )
+    )
+    logger.info("Connected to spotify.")
+
+    database = duckdb.connect(str(database_file))
+    logger.info("Connected to database.")
+    try:
+        poll_recent_tracks(
+            spotify,
+            database,
+            AdaptivePollInterval(
+                min_interval=min_interval, max_interval=max_interval
+            ),
+            sync=sync,
+            sync_interval=sync_interval,
+            max_polls=max_polls,
+            logger=logger,
+        )
+    finally:
+        database.close()
+    logger.info("All done.")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import polars as pl
+from dataclasses import asdict
+from duckdb import DuckDBPyConnection
+from database import upsert_table
+from schema import create_table
+from spotify_smart_playlists.playlists import PlaylistConfig
+from typing import Dict, List
+
+# Bump when playlist evaluation changes in a way that should invalidate
+# every cached playlist.
+ROOT_PLAYLIST_CACHE_VERSION = 1
+
+
+def playlist_config_hash(playlist_config: PlaylistConfig) -> str:
+    config = asdict(playlist_config)
+    # Rotation only matters when loading to Spotify, not to the root
+    # playlist's tracks.
+    config.pop("rotation")
+    config_json = json.dumps(config, sort_keys=True)
+    return hashlib.sha256(config_json.encode("utf-8")).hexdigest()
+
+
+def get_play_stats_version(database: DuckDBPyConnection) -> str:
+    # track_last_played moves with every recorded play, and play stats
+    # windows are relative to today.
+    create_table(database, "track_last_played")
+    version = database.sql(
+        """
+        SELECT
+            CURRENT_DATE,
+            COUNT(*),
+            SUM(play_count),
+            MAX(last_played_at)
+        FROM track_last_played
+        """
+    ).fetchone()
+    return ":".join(str(part) for part in version)
+
+
+def root_playlist_cache_keys(
+    playlist_configs: List[PlaylistConfig],
+    track_facts_version: str,
+    play_stats_version: str,
+) -> Dict[str, str]:
+    """Cache key per playlist name, from its config and the versions of the
+    inputs it reads. Only playlists with play stats depend on plays.
+    """
+    cache_keys: Dict[str, str] = {}
+    for playlist_config in playlist_configs:
+        parts = [
+            str(ROOT_PLAYLIST_CACHE_VERSION),
+            playlist_config_hash(playlist_config),
+            track_facts_version,
+        ]
+        if playlist_config.play_stats is not None:
+            parts.append(play_stats_version)
+        cache_keys[playlist_config.name] = hashlib.sha256(
+            ";".join(parts).encode("utf-8")
+        ).hexdigest()
+    return cache_keys
+
+
+def get_cached_keys(database: DuckDBPyConnection) -> Dict[str, str | None]:
+    create_table(database, "root_playlist_cache")
+    return dict(
+        database.sql(
+            "SELECT name, cache_key FROM root_playlist_cache"
+        ).fetchall()
+    )
+
+
+def save_root_playlists(
+    database: DuckDBPyConnection,
+    playlist_tracks: pl.DataFrame,
+    cache_keys: Dict[str, str],
+    removed: List[str],
+) -> int:
+    """Replaces the root_playlists rows of the playlists in cache_keys with
+    playlist_tracks and records their keys, and deletes the playlists in
+    removed. Rows of any other playlist are left alone. Returns how many
+    rows were written.
+
+    Doesn't open a transaction, callers should.
+    """
+    create_table(database, "root_playlists")
+    create_table(database, "root_playlist_cache")
+    replaced_playlists = pl.DataFrame(  # noqa
+        {"name": list(cache_keys) + removed}, schema={"name": pl.Utf8}
+    )
+    # Rows that are still in the playlist stay put, so this only touches
+    # what actually changed.
+    database.execute(
+        """
+        DELETE FROM root_playlists
+        WHERE
+            name IN (SELECT name FROM replaced_playlists) AND
+            NOT EXISTS (
+                SELECT 1 FROM playlist_tracks
+                WHERE
+                    playlist_tracks.name = root_playlists.name AND
+                    playlist_tracks.track_id = root_playlists.track_id
+            )
+        """
+    )
+    written = upsert_table(database, "root_playlists", playlist_tracks)
+
+    removed_playlists = pl.DataFrame(  # noqa
+        {"name": removed}, schema={"name": pl.Utf8}
+    )
+    database.execute(
+        """
+        DELETE FROM root_playlist_cache
+        WHERE name IN (SELECT name FROM removed_playlists)
+        """
+    )
+    new_cache_keys = pl.DataFrame(  # noqa
+        {
+            "name": list(cache_keys.keys()),
+            "cache_key": list(cache_keys.values()),
+        },
+        schema={"name": pl.Utf8, "cache_key": pl.Utf8},
+    )
+    database.execute(
+        """
+        INSERT OR REPLACE INTO root_playlist_cache (name, cache_key, built_at)
+        SELECT name, cache_key, CURRENT_TIMESTAMP::TIMESTAMP
+        FROM new_cache_keys
+        """
+    )
+    return written
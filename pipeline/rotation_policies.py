@@ -0,0 +1,46 @@
+import polars as pl
+from dataclasses import asdict, fields
+from database import upsert_table
+from duckdb import DuckDBPyConnection
+from schema import create_table
+from spotify_smart_playlists.playlists import PlaylistConfig, RotationConfig
+from typing import Dict, List
+
+
+def save_rotation_policies(
+    database: DuckDBPyConnection, playlist_configs: List[PlaylistConfig]
+) -> int:
+    """Stores every config's rotation policy in root_playlist_rotations,
+    dropping policies of playlists that no longer have a config. Returns
+    how many were inserted or updated.
+    """
+    rotations = pl.DataFrame(
+        [
+            {"name": playlist_config.name, **asdict(playlist_config.rotation)}
+            for playlist_config in playlist_configs
+        ],
+        schema={
+            "name": pl.Utf8,
+            "cooldown_days": pl.Int32,
+            "recency_weight": pl.Float64,
+            "rarity_weight": pl.Float64,
+            "freshness_boost": pl.Float64,
+            "freshness_days": pl.Int32,
+        },
+    )
+    return upsert_table(
+        database, "root_playlist_rotations", rotations, delete_missing=True
+    )
+
+
+def get_rotation_policies(
+    database: DuckDBPyConnection,
+) -> Dict[str, RotationConfig]:
+    create_table(database, "root_playlist_rotations")
+    rotations = database.sql("SELECT * FROM root_playlist_rotations").pl()
+    return {
+        rotation["name"]: RotationConfig(
+            **{f.name: rotation[f.name] for f in fields(RotationConfig)}
+        )
+        for rotation in rotations.to_dicts()
+    }
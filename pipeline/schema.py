@@ -0,0 +1,264 @@
+from dataclasses import dataclass
+from duckdb import DuckDBPyConnection
+from typing import Dict, Tuple
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    name: str
+    # Column name to DuckDB type, in table order.
+    columns: Dict[str, str]
+    primary_key: Tuple[str, ...]
+
+    @property
+    def value_columns(self) -> Tuple[str, ...]:
+        return tuple(c for c in self.columns if c not in self.primary_key)
+
+
+TABLES: Dict[str, TableSchema] = {
+    schema.name: schema
+    for schema in [
+        TableSchema(
+            name="library_tracks",
+            columns={
+                "date_added": "TIMESTAMP",
+                "track_id": "VARCHAR",
+                "track_name": "VARCHAR",
+            },
+            primary_key=("track_id",),
+        ),
+        TableSchema(
+            name="track_artists",
+            columns={"track_id": "VARCHAR", "artist_id": "VARCHAR"},
+            primary_key=("track_id", "artist_id"),
+        ),
+        TableSchema(
+            name="artists",
+            columns={"id": "VARCHAR", "name": "VARCHAR"},
+            primary_key=("id",),
+        ),
+        TableSchema(
+            name="artist_genres",
+            columns={"artist_id": "VARCHAR", "genre": "VARCHAR"},
+            primary_key=("artist_id", "genre"),
+        ),
+        TableSchema(
+            name="artist_fetches",
+            columns={"artist_id": "VARCHAR", "fetched_at": "TIMESTAMP"},
+            primary_key=("artist_id",),
+        ),
+        TableSchema(
+            name="track_audio_features",
+            columns={
+                "track_id": "VARCHAR",
+                "acousticness": "DOUBLE",
+                "danceability": "DOUBLE",
+                "duration_ms": "BIGINT",
+                "energy": "DOUBLE",
+                "instrumentalness": "DOUBLE",
+                "key": "BIGINT",
+                "liveness": "DOUBLE",
+                "loudness": "DOUBLE",
+                "mode": "BIGINT",
+                "speechiness": "DOUBLE",
+                "tempo": "DOUBLE",
+                "time_signature": "BIGINT",
+                "valence": "DOUBLE",
+            },
+            primary_key=("track_id",),
+        ),
+        TableSchema(
+            name="track_audio_features_missing",
+            columns={"track_id": "VARCHAR", "checked_at": "TIMESTAMP"},
+            primary_key=("track_id",),
+        ),
+        TableSchema(
+            name="play_history",
+            columns={"track_id": "VARCHAR", "played_at": "TIMESTAMP"},
+            primary_key=("track_id", "played_at"),
+        ),
+        TableSchema(
+            name="track_last_played",
+            columns={
+                "track_id": "VARCHAR",
+                "last_played_at": "TIMESTAMP",
+                "play_count": "BIGINT",
+            },
+            primary_key=("track_id",),
+        ),
+        TableSchema(
+            name="track_daily_plays",
+            columns={
+                "track_id": "VARCHAR",
+                "play_date": "DATE",
+                "play_count": "BIGINT",
+            },
+            primary_key=("track_id", "play_date"),
+        ),
+        TableSchema(
+            name="root_playlists",
+            columns={"track_id": "VARCHAR", "name": "VARCHAR"},
+            primary_key=("name", "track_id"),
+        ),
+        TableSchema(
+            name="root_playlist_cache",
+            columns={
+                "name": "VARCHAR",
+                "cache_key": "VARCHAR",
+                "built_at": "TIMESTAMP",
+            },
+            primary_key=("name",),
+        ),
+        TableSchema(
+            name="root_playlist_rotations",
+            columns={
+                "name": "VARCHAR",
+                "cooldown_days": "INTEGER",
+                "recency_weight": "DOUBLE",
+                "rarity_weight": "DOUBLE",
+                "freshness_boost": "DOUBLE",
+                "freshness_days": "INTEGER",
+            },
+            primary_key=("name",),
+        ),
+        TableSchema(
+            name="clusters",
+            columns={"cluster": "INTEGER", "name": "VARCHAR"},
+            primary_key=("cluster",),
+        ),
+        TableSchema(
+            name="cluster_features",
+            columns={
+                "feature": "VARCHAR",
+                "mean": "DOUBLE",
+                "scale": "DOUBLE",
+            },
+            primary_key=("feature",),
+        ),
+        TableSchema(
+            name="cluster_centroids",
+            columns={
+                "cluster": "INTEGER",
+                "feature": "VARCHAR",
+                "value": "DOUBLE",
+            },
+            primary_key=("cluster", "feature"),
+        ),
+        TableSchema(
+            name="cluster_fits",
+            columns={
+                "fitted_at": "TIMESTAMP",
+                "requested_clusters": "INTEGER",
+            },
+            primary_key=("fitted_at",),
+        ),
+        TableSchema(
+            name="track_clusters",
+            columns={"track_id": "VARCHAR", "cluster": "INTEGER"},
+            primary_key=("track_id",),
+        ),
+        TableSchema(
+            name="derived_tables",
+            columns={
+                "name": "VARCHAR",
+                "fingerprint": "VARCHAR",
+                "built_at": "TIMESTAMP",
+            },
+            primary_key=("name",),
+        ),
+        TableSchema(
+            name="extraction_checkpoints",
+            columns={
+                "job": "VARCHAR",
+                "position": "BIGINT",
+                "cursor": "VARCHAR",
+                "updated_at": "TIMESTAMP",
+            },
+            primary_key=("job",),
+        ),
+    ]
+}
+
+
+def get_table_schema(table: str) -> TableSchema:
+    if table not in TABLES:
+        raise ValueError(f"No schema declared for table {table}.")
+    return TABLES[table]
+
+
+def create_table(database: DuckDBPyConnection, table: str):
+    """Creates table from its declared schema if it doesn't exist.
+
+    Tables that predate the registry were made with CREATE TABLE AS and have
+    no primary key, so those get the key as a unique index instead, which is
+    all ON CONFLICT needs. Blind inserts from retried runs left duplicate
+    keys in some of them, and only the first row of each key is kept.
+    """
+    schema = get_table_schema(table)
+    primary_key = ", ".join(schema.primary_key)
+    tables = {x[0] for x in database.sql("SHOW TABLES").fetchall()}
+    if table not in tables:
+        columns = ", ".join(
+            f"{column} {column_type}"
+            for column, column_type in schema.columns.items()
+        )
+        database.execute(
+            f"CREATE TABLE {table} ({columns}, PRIMARY KEY ({primary_key}))"
+        )
+    elif not has_primary_key(database, table):
+        deduplicate_table(database, table)
+        database.execute(
+            f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS {table}_primary_key
+            ON {table} ({primary_key})
+            """
+        )
+
+
+def has_primary_key(database: DuckDBPyConnection, table: str) -> bool:
+    return (
+        database.execute(
+            """
+            SELECT COUNT(*) FROM duckdb_constraints()
+            WHERE table_name = ? AND constraint_type = 'PRIMARY KEY'
+            """,
+            [table],
+        ).fetchone()[0]
+        > 0
+    )
+
+
+def has_duplicate_keys(database: DuckDBPyConnection, table: str) -> bool:
+    primary_key = ", ".join(get_table_schema(table).primary_key)
+    return (
+        database.sql(
+            f"""
+            SELECT 1 FROM {table}
+            GROUP BY {primary_key}
+            HAVING COUNT(*) > 1
+            LIMIT 1
+            """
+        ).fetchone()
+        is not None
+    )
+
+
+def deduplicate_table(database: DuckDBPyConnection, table: str) -> bool:
+    """Keeps only the first row of each primary key in table, returning
+    whether there was anything to drop.
+    """
+    if not has_duplicate_keys(database, table):
+        return False
+    primary_key = ", ".join(get_table_schema(table).primary_key)
+    # Rebuilt rather than deleted from, index builds still see rows deleted
+    # earlier in the same transaction.
+    database.execute(
+        f"""
+        CREATE OR REPLACE TABLE {table} AS
+        SELECT * FROM {table}
+        QUALIFY ROW_NUMBER() OVER (
+            PARTITION BY {primary_key} ORDER BY rowid
+        ) = 1
+        """
+    )
+    return True
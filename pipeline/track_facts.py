@@ -0,0 +1,122 @@
+import hashlib
+import loguru
+from duckdb import DuckDBPyConnection
+from schema import create_table
+from typing import List
+
+TRACK_FACTS_INPUTS = [
+    "library_tracks",
+    "track_artists",
+    "artists",
+    "artist_genres",
+    "track_audio_features",
+]
+
+
+def table_fingerprint(database: DuckDBPyConnection, tables: List[str]) -> str:
+    """Order independent checksum of the contents of tables, for telling
+    whether something derived from them is stale without rebuilding it.
+    """
+    parts: List[str] = []
+    for table in tables:
+        count, checksum = database.sql(
+            f"SELECT COUNT(*), SUM(HASH({table})::HUGEINT) FROM {table}"
+        ).fetchone()
+        parts.append(f"{table}:{count}:{checksum}")
+    return hashlib.sha256(";".join(parts).encode("utf-8")).hexdigest()
+
+
+def get_derived_fingerprint(
+    database: DuckDBPyConnection, name: str
+) -> str | None:
+    create_table(database, "derived_tables")
+    fingerprint = database.execute(
+        "SELECT fingerprint FROM derived_tables WHERE name = ?", [name]
+    ).fetchone()
+    return fingerprint[0] if fingerprint else None
+
+
+def save_derived_fingerprint(
+    database: DuckDBPyConnection, name: str, fingerprint: str
+):
+    create_table(database, "derived_tables")
+    database.execute(
+        """
+        INSERT OR REPLACE INTO derived_tables (name, fingerprint, built_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP::TIMESTAMP)
+        """,
+        [name, fingerprint],
+    )
+
+
+def refresh_track_facts(
+    database: DuckDBPyConnection, logger=loguru.logger
+) -> str:
+    """Rebuilds track_facts - one row per library track with its audio
+    features and lists of artist names and genres - if any of its inputs
+    changed since the last build. Returns the fingerprint of the inputs it's
+    now built from.
+
+    It's wholesale CREATE OR REPLACE rather than an upsert because DuckDB
+    can't update list columns in place.
+    """
+    for table in TRACK_FACTS_INPUTS:
+        create_table(database, table)
+    tables = {x[0] for x in database.sql("SHOW TABLES").fetchall()}
+    fingerprint = table_fingerprint(database, TRACK_FACTS_INPUTS)
+    if (
+        "track_facts" in tables
+        and get_derived_fingerprint(database, "track_facts") == fingerprint
+    ):
+        logger.info("track_facts is up to date.")
+        return fingerprint
+
+    logger.info("Inputs changed, rebuilding track_facts.")
+    database.begin()
+    try:
+        # Names and genres are aggregated separately so neither fans out
+        # the other.
+        database.execute(
+            """
+            CREATE OR REPLACE TABLE track_facts AS
+            WITH track_artist_names AS (
+                SELECT
+                    track_artists.track_id,
+                    LIST_SORT(LIST_DISTINCT(LIST(artists.name)))
+                        AS artist_names
+                FROM track_artists
+                INNER JOIN artists
+                    ON track_artists.artist_id = artists.id
+                GROUP BY track_artists.track_id
+            ), track_genres AS (
+                SELECT
+                    track_artists.track_id,
+                    LIST_SORT(LIST_DISTINCT(LIST(artist_genres.genre)))
+                        AS genres
+                FROM track_artists
+                INNER JOIN artist_genres
+                    ON track_artists.artist_id = artist_genres.artist_id
+                GROUP BY track_artists.track_id
+            )
+            SELECT
+                library_tracks.track_id,
+                library_tracks.date_added,
+                track_audio_features.* EXCLUDE (track_id),
+                COALESCE(track_artist_names.artist_names, [])
+                    AS artist_names,
+                COALESCE(track_genres.genres, []) AS genres
+            FROM library_tracks
+            LEFT JOIN track_audio_features
+                ON library_tracks.track_id = track_audio_features.track_id
+            LEFT JOIN track_artist_names
+                ON library_tracks.track_id = track_artist_names.track_id
+            LEFT JOIN track_genres
+                ON library_tracks.track_id = track_genres.track_id
+            """
+        )
+        save_derived_fingerprint(database, "track_facts", fingerprint)
+        database.commit()
+    except Exception:
+        database.rollback()
+        raise
+    return fingerprint
@@ -1,8 +1,14 @@
 import typer
 from prefect import flow, get_run_logger, task
-from spotify_smart_playlists.helpers import SpotifyCredentials, spotify_auth
+from spotify_smart_playlists.helpers import (
+    SpotifyCredentials,
+    spotify_auth,
+    RateLimitedSpotify,
+)
 from spotify_smart_playlists.extract import pull_artists
-from database import table_exists, save_to_database
+from database import table_exists
+from schema import create_table
+from migrations import run_migrations_task
 import spotipy
 import duckdb
 from duckdb import DuckDBPyConnection
@@ -10,42 +16,186 @@ import polars as pl
 from typing import Optional, List, Tuple
 
 
+def get_missing_artists(
+    database: DuckDBPyConnection, artists_table_exists: bool, refresh_days: int
+) -> List[str]:
+    """Track artists that aren't in the artists table, leaving out ids that
+    were asked for in the last refresh_days days - Spotify returns nothing
+    for some, and those would otherwise be requested on every run.
+    """
+    create_table(database, "artist_fetches")
+    known_filter = (
+        """AND NOT EXISTS (
+            SELECT 1 FROM artists WHERE artists.id = track_artists.artist_id
+        )"""
+        if artists_table_exists
+        else ""
+    )
+    missing_artists = database.execute(
+        f"""
+        SELECT DISTINCT track_artists.artist_id
+        FROM track_artists
+        LEFT JOIN artist_fetches
+            ON track_artists.artist_id = artist_fetches.artist_id
+        WHERE
+            (
+                artist_fetches.fetched_at IS NULL OR
+                DATE_DIFF('day', artist_fetches.fetched_at, CURRENT_DATE) >= ?
+            )
+            {known_filter}
+        """,
+        [refresh_days],
+    ).fetchall()
+    return [a[0] for a in missing_artists]
+
+
+def record_artist_fetches(
+    database: DuckDBPyConnection, requested_artist_ids: List[str]
+):
+    """Stamps every requested artist as fetched now, including the ones
+    Spotify returned nothing for.
+    """
+    create_table(database, "artist_fetches")
+    requested_artists = pl.DataFrame(  # noqa
+        {"artist_id": requested_artist_ids}, schema={"artist_id": pl.Utf8}
+    )
+    database.execute(
+        """
+        INSERT OR REPLACE INTO artist_fetches
+        SELECT DISTINCT artist_id, CURRENT_TIMESTAMP::TIMESTAMP
+        FROM requested_artists
+        """
+    )
+
+
 @task(name="Determine missing artists")
 def determine_missing_artists(
-    database: DuckDBPyConnection, artists_table_exists: bool
+    database: DuckDBPyConnection, artists_table_exists: bool, refresh_days: int
 ) -> List[str]:
     logger = get_run_logger()
     logger.info(
         "Determining which artists are missing from the artists table."
     )
-    if artists_table_exists:
-        missing_artists = database.sql(
-            """
-            SELECT DISTINCT artist_id
-            FROM track_artists
-            LEFT JOIN artists
-                ON track_artists.artist_id = artists.id
-            WHERE
-                artists.id IS NULL
-            """
-        ).fetchall()
-    else:
+    if not artists_table_exists:
         logger.info(
             "artists table does not exist, pulling all track artist ids."
         )
-        missing_artists = database.sql(
-            """ SELECT DISTINCT artist_id FROM track_artists
+    return get_missing_artists(database, artists_table_exists, refresh_days)
+
+
+@task(name="Determine stale artists")
+def determine_stale_artists(
+    database: DuckDBPyConnection, refresh_days: int, max_refresh: int
+) -> List[str]:
+    logger = get_run_logger()
+    create_table(database, "artist_fetches")
+    # Artists fetched before the fetch log existed have no entry, so they
+    # go first and get worked through a slice at a time.
+    stale_artists = database.execute(
+        """
+        SELECT artists.id
+        FROM artists
+        LEFT JOIN artist_fetches
+            ON artists.id = artist_fetches.artist_id
+        WHERE
+            artists.id IN (SELECT artist_id FROM track_artists) AND (
+                artist_fetches.fetched_at IS NULL OR
+                DATE_DIFF('day', artist_fetches.fetched_at, CURRENT_DATE) >= ?
+            )
+        ORDER BY artist_fetches.fetched_at ASC NULLS FIRST
+        LIMIT ?
+        """,
+        [refresh_days, max_refresh],
+    ).fetchall()
+    logger.info(f"Refreshing {len(stale_artists)} stale artists.")
+    return [a[0] for a in stale_artists]
+
+
+@task(name="Merge artists")
+def merge_artists_task(
+    database: DuckDBPyConnection,
+    requested_artist_ids: List[str],
+    pulled_artists: pl.DataFrame,
+    pulled_artist_genres: pl.DataFrame,
+):
+    logger = get_run_logger()
+    create_table(database, "artist_fetches")
+    database.begin()
+    try:
+        # Make sure both tables exist even if this is the first pull and
+        # nobody had any genres.
+        create_table(database, "artists")
+        create_table(database, "artist_genres")
+        renamed = database.execute(
             """
-        ).fetchall()
-    return [a[0] for a in missing_artists]
+            UPDATE artists SET name = pulled_artists.name
+            FROM pulled_artists
+            WHERE
+                artists.id = pulled_artists.id AND
+                artists.name IS DISTINCT FROM pulled_artists.name
+            """
+        ).fetchone()[0]
+        added = database.execute(
+            """
+            INSERT INTO artists (id, name)
+            SELECT id, name FROM pulled_artists
+            WHERE NOT EXISTS (
+                SELECT 1 FROM artists WHERE artists.id = pulled_artists.id
+            )
+            """
+        ).fetchone()[0]
+        # Only genre rows that actually changed for the pulled artists get
+        # touched.
+        genres_removed = database.execute(
+            """
+            DELETE FROM artist_genres
+            WHERE
+                artist_id IN (SELECT id FROM pulled_artists) AND
+                NOT EXISTS (
+                    SELECT 1 FROM pulled_artist_genres AS pag
+                    WHERE
+                        pag.artist_id = artist_genres.artist_id AND
+                        pag.genre = artist_genres.genre
+                )
+            """
+        ).fetchone()[0]
+        genres_added = database.execute(
+            """
+            INSERT INTO artist_genres (artist_id, genre)
+            SELECT artist_id, genre FROM pulled_artist_genres AS pag
+            WHERE NOT EXISTS (
+                SELECT 1 FROM artist_genres
+                WHERE
+                    artist_genres.artist_id = pag.artist_id AND
+                    artist_genres.genre = pag.genre
+            )
+            """
+        ).fetchone()[0]
+        record_artist_fetches(database, requested_artist_ids)
+        database.commit()
+    except Exception:
+        database.rollback()
+        raise
+    logger.info(
+        f"Added {added} artists and renamed {renamed}. "
+        f"Added {genres_added} artist genres and removed {genres_removed}."
+    )
+    unknown = len(set(requested_artist_ids)) - pulled_artists.shape[0]
+    if unknown > 0:
+        logger.info(f"Spotify had nothing for {unknown} artist ids.")
 
 
-@task(name="Pull missing artists")
+@task(name="Pull artists")
 def pull_artists_task(
-    spotify: spotipy.Spotify, artists_to_pull: List[str]
+    spotify: spotipy.Spotify, artists_to_pull: List[str], max_concurrency: int
 ) -> Tuple[pl.DataFrame, pl.DataFrame]:
     logger = get_run_logger()
-    return pull_artists(spotify, artists_to_pull, logger=logger)
+    return pull_artists(
+        spotify,
+        artists_to_pull,
+        logger=logger,
+        max_concurrency=max_concurrency,
+    )
 
 
 @flow(name="Update artists")
@@ -55,6 +205,9 @@ def update_artists(
     client_id: Optional[str] = None,
     client_secret: Optional[str] = None,
     redirect_uri: Optional[str] = None,
+    max_concurrency: int = 4,
+    refresh_days: int = 30,
+    max_refresh: int = 200,
 ):
     logger = get_run_logger()
     credentials: SpotifyCredentials | None = None
@@ -69,7 +222,7 @@ def update_artists(
     else:
         logger.info("Insufficient explicit credentials, using environment.")
 
-    spotify = spotipy.Spotify(
+    spotify = RateLimitedSpotify(
         client_credentials_manager=spotify_auth(
             database_file, credentials=credentials, cache_key=cache_fernet_key
         )
@@ -77,27 +230,26 @@ def update_artists(
     logger.info("Connected to spotify.")
 
     database = duckdb.connect(database_file)
+    run_migrations_task(database)
     artists_table_exists = table_exists(database, "artists")
-    artist_genres_table_exists = table_exists(database, "artist_genres")
-    missing_artists = determine_missing_artists(database, artists_table_exists)
-    if missing_artists:
-        new_artists_frame, new_artist_genres_frame = pull_artists_task(
-            spotify, missing_artists
+    missing_artists = determine_missing_artists(
+        database, artists_table_exists, refresh_days
+    )
+    stale_artists: List[str] = []
+    if artists_table_exists:
+        stale_artists = determine_stale_artists(
+            database, refresh_days, max_refresh
         )
-        save_to_database(
-            database=database,
-            table="artists",
-            data_frame=new_artists_frame,
-            create_or_replace=(not artists_table_exists),
+    if missing_artists or stale_artists:
+        artists_to_pull = missing_artists + stale_artists
+        pulled_artists, pulled_artist_genres = pull_artists_task(
+            spotify, artists_to_pull, max_concurrency
         )
-        save_to_database(
-            database=database,
-            table="artist_genres",
-            data_frame=new_artist_genres_frame,
-            create_or_replace=(not artist_genres_table_exists),
+        merge_artists_task(
+            database, artists_to_pull, pulled_artists, pulled_artist_genres
         )
     else:
-        logger.info("No new artists to pull.")
+        logger.info("No new or stale artists to pull.")
     database.close()
 
 
@@ -1,9 +1,15 @@
 import typer
 from prefect import flow, get_run_logger, task
 from typing import Optional
-from spotify_smart_playlists.helpers import SpotifyCredentials, spotify_auth
+from spotify_smart_playlists.helpers import (
+    SpotifyCredentials,
+    spotify_auth,
+    RateLimitedSpotify,
+)
 from spotify_smart_playlists.extract import pull_recent_tracks
-from database import table_exists, save_to_database
+from database import table_exists
+from plays import record_plays
+from migrations import run_migrations_task
 import spotipy
 import duckdb
 from duckdb import DuckDBPyConnection
@@ -28,6 +34,21 @@ def pull_recent_tracks_task(
     return pull_recent_tracks(spotify, latest_played_at, logger=logger)
 
 
+@task(name="Record plays")
+def record_plays_task(
+    database: DuckDBPyConnection, recent_tracks: pl.DataFrame
+):
+    logger = get_run_logger()
+    database.begin()
+    try:
+        new_plays = record_plays(database, recent_tracks)
+        database.commit()
+    except Exception:
+        database.rollback()
+        raise
+    logger.info(f"Saved {new_plays} new plays to play_history.")
+
+
 @flow(name="Pull recent tracks")
 def update_recent_tracks(
     database_file: str = "spotify.db",
@@ -48,7 +69,7 @@ def update_recent_tracks(
     else:
         logger.info("Insufficient explicit credentials, using environment.")
 
-    spotify = spotipy.Spotify(
+    spotify = RateLimitedSpotify(
         client_credentials_manager=spotify_auth(
             database_file, credentials=credentials, cache_key=cache_fernet_key
         )
@@ -58,6 +79,7 @@ def update_recent_tracks(
 
     database = duckdb.connect(database_file)
     logger.info("Connected to database.")
+    run_migrations_task(database)
 
     play_history_exists = table_exists(database, "play_history")
     latest_played_at: datetime | None = None
@@ -68,13 +90,7 @@ def update_recent_tracks(
     recent_tracks = pull_recent_tracks_task(spotify, latest_played_at)
 
     if recent_tracks is not None:
-        save_to_database(
-            database=database,
-            table="play_history",
-            data_frame=recent_tracks,
-            # if play_history exists, append.
-            create_or_replace=(not play_history_exists),
-        )
+        record_plays_task(database, recent_tracks)
     else:
         logger.info("No new tracks to save. All done.")
     database.close()
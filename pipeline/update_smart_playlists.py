@@ -1,5 +1,5 @@
 import typer
-from prefect import flow, task
+from prefect import flow, task, get_run_logger
 import duckdb
 from typing import Optional
 from update_recent_tracks import update_recent_tracks
@@ -7,8 +7,10 @@ from pull_library import pull_library
 from update_artists import update_artists
 from update_track_audio_features import update_track_audio_features
 from build_root_playlists import build_root_playlists
+from build_cluster_playlists import build_cluster_playlists
 from load_smart_playlists import load_smart_playlists
 from pathlib import Path
+from spotify_smart_playlists.helpers import get_rate_limiter
 
 
 @task(
@@ -61,6 +63,7 @@ def update_smart_playlists(
     build_root_playlists(
         database_file=database_file, playlist_config_dir=playlist_config_dir
     )
+    build_cluster_playlists(database_file=database_file)
     load_smart_playlists(
         database_file=database_file,
         cache_fernet_key=cache_fernet_key,
@@ -82,6 +85,9 @@ def update_smart_playlists(
             table_path = exported_data_dir / f"{table}.parquet"
             export_table_to_parquet(table, db, table_path)
 
+    logger = get_run_logger()
+    logger.info(f"Spotify rate limit budget: {get_rate_limiter().budget}")
+
 
 if __name__ == "__main__":
     typer.run(update_smart_playlists)
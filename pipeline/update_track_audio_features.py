@@ -1,47 +1,185 @@
 import typer
 from prefect import flow, get_run_logger, task
-from spotify_smart_playlists.helpers import SpotifyCredentials, spotify_auth
-from spotify_smart_playlists.extract import pull_audio_features
-from database import table_exists, save_to_database
+from spotify_smart_playlists.helpers import (
+    SpotifyCredentials,
+    spotify_auth,
+    RateLimitedSpotify,
+)
+from spotify_smart_playlists.extract import (
+    pull_audio_features,
+    iter_audio_features,
+)
+from database import table_exists, save_to_database, upsert_table
+from schema import create_table
+from checkpoints import get_checkpoint, save_checkpoint, clear_checkpoint
+from migrations import run_migrations_task
 import spotipy
 import duckdb
 from duckdb import DuckDBPyConnection
 import polars as pl
 from typing import Optional, List
 
+TRACK_AUDIO_FEATURES_JOB = "track_audio_features"
+
+
+def record_missing_audio_features(
+    database: DuckDBPyConnection,
+    requested_track_ids: List[str],
+    track_audio_features: pl.DataFrame,
+) -> int:
+    """Remembers which requested tracks Spotify had no audio features for,
+    so they aren't asked for again until the retry window is up.
+    """
+    create_table(database, "track_audio_features_missing")
+    found_tracks = track_audio_features.select("track_id")  # noqa
+    found_track_ids = set(found_tracks.get_column("track_id"))
+    missing_track_ids = pl.DataFrame(  # noqa
+        {
+            "track_id": [
+                track_id
+                for track_id in requested_track_ids
+                if track_id not in found_track_ids
+            ]
+        },
+        schema={"track_id": pl.Utf8},
+    )
+    database.execute(
+        """
+        INSERT OR REPLACE INTO track_audio_features_missing
+        SELECT track_id, CURRENT_TIMESTAMP::TIMESTAMP
+        FROM missing_track_ids
+        """
+    )
+    # A track that finally got analyzed doesn't need the entry any more.
+    database.execute(
+        """
+        DELETE FROM track_audio_features_missing
+        WHERE track_id IN (SELECT track_id FROM found_tracks)
+        """
+    )
+    return missing_track_ids.shape[0]
+
 
 @task(name="Get tracks without audio features")
 def get_tracks_without_audio_features_task(
-    database: DuckDBPyConnection, track_audio_features_exists: bool
+    database: DuckDBPyConnection,
+    track_audio_features_exists: bool,
+    missing_retry_days: int,
 ) -> List[str]:
+    logger = get_run_logger()
+    create_table(database, "track_audio_features_missing")
+    # Tracks Spotify had nothing for are skipped until their retry window
+    # is up, otherwise they'd be requested on every single run.
     if track_audio_features_exists:
-        tracks_without_audio_features = database.query(
+        tracks_without_audio_features = database.execute(
             """
             SELECT lt.track_id
             FROM library_tracks AS lt
             LEFT JOIN track_audio_features AS taf
                 ON lt.track_id = taf.track_id
+            LEFT JOIN track_audio_features_missing AS tafm
+                ON lt.track_id = tafm.track_id
             WHERE
-                taf.track_id IS NULL
-            """
+                taf.track_id IS NULL AND (
+                    tafm.track_id IS NULL OR
+                    DATE_DIFF('day', tafm.checked_at, CURRENT_DATE) >= ?
+                )
+            """,
+            [missing_retry_days],
         ).fetchall()
     else:
         tracks_without_audio_features = database.query(
             "SELECT DISTINCT track_id FROM library_tracks"
         ).fetchall()
+    logger.info(
+        f"Found {len(tracks_without_audio_features)} tracks without audio "
+        "features."
+    )
     return [t[0] for t in tracks_without_audio_features]
 
 
+@task(name="Record missing audio features")
+def record_missing_audio_features_task(
+    database: DuckDBPyConnection,
+    requested_track_ids: List[str],
+    track_audio_features: pl.DataFrame,
+):
+    logger = get_run_logger()
+    missing = record_missing_audio_features(
+        database, requested_track_ids, track_audio_features
+    )
+    logger.info(f"Spotify had no audio features for {missing} tracks.")
+
+
 @task(name="Pull audio features")
 def pull_audio_features_task(
-    spotify: spotipy.Spotify, track_audio_features_to_pull: List[str]
+    spotify: spotipy.Spotify,
+    track_audio_features_to_pull: List[str],
+    max_concurrency: int,
 ) -> pl.DataFrame:
     logger = get_run_logger()
     return pull_audio_features(
-        spotify, track_audio_features_to_pull, logger=logger
+        spotify,
+        track_audio_features_to_pull,
+        logger=logger,
+        max_concurrency=max_concurrency,
     )
 
 
+@task(name="Stream audio features")
+def stream_audio_features_task(
+    spotify: spotipy.Spotify,
+    database: DuckDBPyConnection,
+    track_audio_features_to_pull: List[str],
+    chunk_size: int,
+    max_concurrency: int,
+):
+    logger = get_run_logger()
+    # Finished chunks are already left out of the list (stored features or
+    # the missing cache), so the checkpoint is only reported, not used to
+    # filter - tracks saved since the failed run can sort anywhere.
+    checkpoint = get_checkpoint(database, TRACK_AUDIO_FEATURES_JOB)
+    if checkpoint is not None:
+        logger.info(
+            f"Resuming audio features, last run stopped after "
+            f"{checkpoint.cursor} at {checkpoint.updated_at}."
+        )
+    # Each chunk is written with its checkpoint as soon as it's pulled, so
+    # memory stays flat and a failed run picks up where it stopped.
+    for chunk in iter_audio_features(
+        spotify,
+        track_audio_features_to_pull,
+        logger=logger,
+        chunk_size=chunk_size,
+        max_concurrency=max_concurrency,
+    ):
+        logger.info(
+            f"Saving {chunk.track_audio_features.shape[0]} "
+            "track audio features."
+        )
+        database.begin()
+        try:
+            upsert_table(
+                database, "track_audio_features", chunk.track_audio_features
+            )
+            missing = record_missing_audio_features(
+                database, chunk.track_ids, chunk.track_audio_features
+            )
+            if missing:
+                logger.info(
+                    f"Spotify had no audio features for {missing} tracks."
+                )
+            save_checkpoint(
+                database,
+                TRACK_AUDIO_FEATURES_JOB,
+                cursor=chunk.track_ids[-1],
+            )
+            database.commit()
+        except Exception:
+            database.rollback()
+            raise
+
+
 @flow(name="Update track audio features")
 def update_track_audio_features(
     database_file: str = "spotify.db",
@@ -49,6 +187,10 @@ def update_track_audio_features(
     client_id: Optional[str] = None,
     client_secret: Optional[str] = None,
     redirect_uri: Optional[str] = None,
+    max_concurrency: int = 4,
+    stream: bool = True,
+    chunk_size: int = 1000,
+    missing_retry_days: int = 30,
 ):
     logger = get_run_logger()
     credentials: SpotifyCredentials | None = None
@@ -63,7 +205,7 @@ def update_track_audio_features(
     else:
         logger.info("Insufficient explicit credentials, using environment.")
 
-    spotify = spotipy.Spotify(
+    spotify = RateLimitedSpotify(
         client_credentials_manager=spotify_auth(
             database_file, credentials=credentials, cache_key=cache_fernet_key
         )
@@ -71,27 +213,42 @@ def update_track_audio_features(
     logger.info("Connected to Spotify.")
 
     database = duckdb.connect(database_file)
+    run_migrations_task(database)
     track_audio_features_exists = table_exists(
         database, "track_audio_features"
     )
 
     track_ids_without_audio_features = get_tracks_without_audio_features_task(
-        database, track_audio_features_exists
+        database, track_audio_features_exists, missing_retry_days
     )
 
-    if track_ids_without_audio_features:
+    if track_ids_without_audio_features and stream:
+        stream_audio_features_task(
+            spotify,
+            database,
+            track_ids_without_audio_features,
+            chunk_size,
+            max_concurrency,
+        )
+    elif track_ids_without_audio_features:
         track_audio_features = pull_audio_features_task(
-            spotify, track_ids_without_audio_features
+            spotify, track_ids_without_audio_features, max_concurrency
         )
 
         save_to_database(
             database=database,
             table="track_audio_features",
             data_frame=track_audio_features,
-            create_or_replace=(not track_audio_features_exists),
+            upsert=True,
+        )
+        record_missing_audio_features_task(
+            database, track_ids_without_audio_features, track_audio_features
         )
     else:
         logger.info("No new track audio features.")
+    # Every track is accounted for, including when a failed run's leftovers
+    # got picked up some other way.
+    clear_checkpoint(database, TRACK_AUDIO_FEATURES_JOB)
     database.close()
 
 
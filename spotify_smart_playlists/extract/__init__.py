@@ -1,11 +1,33 @@
-from .library import pull_library_tracks
-from .artists import pull_artists
-from .recent_tracks import pull_recent_tracks
-from .audio_features import pull_audio_features
+from .async_client import AsyncSpotify
+from .library import (
+    pull_library_tracks,
+    pull_library_tracks_async,
+    iter_library_tracks,
+    get_library_track_count,
+    LibraryTracksChunk,
+)
+from .artists import pull_artists, pull_artists_async
+from .recent_tracks import pull_recent_tracks, pull_recent_tracks_async
+from .audio_features import (
+    pull_audio_features,
+    pull_audio_features_async,
+    iter_audio_features,
+    AudioFeaturesChunk,
+)
 
 __all__ = [
+    "AsyncSpotify",
     "pull_library_tracks",
+    "pull_library_tracks_async",
+    "iter_library_tracks",
+    "get_library_track_count",
+    "LibraryTracksChunk",
     "pull_recent_tracks",
+    "pull_recent_tracks_async",
     "pull_artists",
+    "pull_artists_async",
     "pull_audio_features",
+    "pull_audio_features_async",
+    "iter_audio_features",
+    "AudioFeaturesChunk",
 ]
@@ -1,39 +1,90 @@
+import asyncio
 import spotipy
 import polars as pl
 from loguru import logger
-from typing import List, Tuple
-from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Tuple
 from toolz import partition_all
+from .async_client import AsyncSpotify
+from .frame_builder import FrameBuilder
 
 
-@dataclass
-class Artist:
-    id: str
-    name: str
+ARTISTS_SCHEMA: Dict[str, pl.PolarsDataType] = {
+    "id": pl.Utf8,
+    "name": pl.Utf8,
+}
 
+ARTIST_GENRES_SCHEMA: Dict[str, pl.PolarsDataType] = {
+    "artist_id": pl.Utf8,
+    "genre": pl.Utf8,
+}
 
-@dataclass
-class ArtistGenre:
-    artist_id: str
-    genre: str
+
+def _append_artists(
+    artists_response: Dict[str, Any],
+    new_artists: FrameBuilder,
+    new_artist_genres: FrameBuilder,
+):
+    for artist in artists_response["artists"]:
+        # Unknown ids come back as null.
+        if artist is None:
+            continue
+        new_artists.append(artist["id"], artist["name"])
+        for genre in artist["genres"]:
+            new_artist_genres.append(artist["id"], genre)
+
+
+async def pull_artists_async(
+    spotify: AsyncSpotify, artists_to_pull: List[str], logger=logger
+) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    artist_batches = list(partition_all(50, artists_to_pull))
+    logger.info(
+        f"Pulling {len(artists_to_pull)} artists in {len(artist_batches)} "
+        f"batches of 50, {spotify.max_concurrency} at a time."
+    )
+    # gather keeps the responses in batch order.
+    artists_responses = await asyncio.gather(
+        *[
+            spotify.get("artists", ids=",".join(artist_batch))
+            for artist_batch in artist_batches
+        ]
+    )
+    new_artists = FrameBuilder(ARTISTS_SCHEMA)
+    new_artist_genres = FrameBuilder(ARTIST_GENRES_SCHEMA)
+    for artists_response in artists_responses:
+        _append_artists(artists_response, new_artists, new_artist_genres)
+    return new_artists.build(), new_artist_genres.build()
 
 
 def pull_artists(
-    spotify: spotipy.Spotify, artists_to_pull: List[str], logger=logger
+    spotify: spotipy.Spotify,
+    artists_to_pull: List[str],
+    logger=logger,
+    max_concurrency: int = 1,
 ) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    if max_concurrency > 1:
+        return asyncio.run(
+            _pull_artists_concurrently(
+                spotify, artists_to_pull, max_concurrency, logger=logger
+            )
+        )
+
     logger.info(f"Batching {len(artists_to_pull)} into batches of 50.")
-    new_artists: List[Artist] = []
-    new_artist_genres: List[ArtistGenre] = []
+    new_artists = FrameBuilder(ARTISTS_SCHEMA)
+    new_artist_genres = FrameBuilder(ARTIST_GENRES_SCHEMA)
     for artist_batch in partition_all(50, artists_to_pull):
         logger.info(f"Pulling {len(artist_batch)} artists.")
         artists_response = spotify.artists(artist_batch)
-        for artist in artists_response["artists"]:
-            new_artists.append(Artist(id=artist["id"], name=artist["name"]))
-            for genre in artist["genres"]:
-                new_artist_genres.append(
-                    ArtistGenre(artist_id=artist["id"], genre=genre)
-                )
-    new_artists_frame = pl.from_dicts(map(asdict, new_artists))
-    new_artist_genres_frame = pl.from_dicts(map(asdict, new_artist_genres))
-
-    return new_artists_frame, new_artist_genres_frame
+        _append_artists(artists_response, new_artists, new_artist_genres)
+    return new_artists.build(), new_artist_genres.build()
+
+
+async def _pull_artists_concurrently(
+    spotify: spotipy.Spotify,
+    artists_to_pull: List[str],
+    max_concurrency: int,
+    logger=logger,
+) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    async with AsyncSpotify(spotify, max_concurrency) as async_spotify:
+        return await pull_artists_async(
+            async_spotify, artists_to_pull, logger=logger
+        )
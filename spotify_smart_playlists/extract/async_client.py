@@ -0,0 +1,106 @@
+import asyncio
+import httpx
+import spotipy
+from spotipy import SpotifyException
+from spotify_smart_playlists.helpers.rate_limit import (
+    RateLimiter,
+    get_rate_limiter,
+    retry_after_seconds,
+)
+from typing import Any, Dict
+
+
+class AsyncSpotify:
+    """Bare bones asyncio client for the read-only Spotify endpoints the
+    extractors use.
+
+    All requests go through one pooled httpx client so concurrent batches
+    reuse keep-alive connections, and a semaphore bounds how many are in
+    flight at once. Auth is borrowed from an existing spotipy client, and
+    every request is metered by the shared rate limiter.
+    """
+
+    def __init__(
+        self,
+        spotify: spotipy.Spotify,
+        max_concurrency: int = 8,
+        rate_limiter: RateLimiter | None = None,
+        max_throttled_retries: int = 5,
+    ):
+        self.spotify = spotify
+        self.max_concurrency = max_concurrency
+        # Share the limiter with the sync client if it has one so both kinds
+        # of calls draw from the same budget.
+        self.rate_limiter = (
+            rate_limiter
+            or getattr(spotify, "rate_limiter", None)
+            or get_rate_limiter()
+        )
+        self.max_throttled_retries = max_throttled_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._token_lock = asyncio.Lock()
+        self._token: str | None = None
+        self._client = httpx.AsyncClient(
+            base_url=spotify.prefix,
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+            timeout=spotify.requests_timeout,
+        )
+
+    async def __aenter__(self) -> "AsyncSpotify":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _access_token(self, stale_token: str | None = None) -> str:
+        async with self._token_lock:
+            # Only refresh if nobody else replaced the stale token while we
+            # were waiting on the lock.
+            if self._token is None or self._token == stale_token:
+                # The auth manager blocks (and reads the token cache from
+                # the database), so keep it off the event loop.
+                self._token = await asyncio.to_thread(
+                    self.spotify.auth_manager.get_access_token, as_dict=False
+                )
+            return self._token
+
+    async def get(self, path: str, **params: Any) -> Dict[str, Any]:
+        stale_token: str | None = None
+        throttled = 0
+        while True:
+            token = await self._access_token(stale_token=stale_token)
+            async with self._semaphore:
+                await self.rate_limiter.acquire_async()
+                response = await self._client.get(
+                    path,
+                    params=params,
+                    headers={"Authorization": f"Bearer {token}"},
+                )
+            if response.status_code == 401 and stale_token is None:
+                stale_token = token
+                continue
+            if (
+                response.status_code == 429
+                and throttled < self.max_throttled_retries
+            ):
+                throttled += 1
+                self.rate_limiter.throttled(
+                    retry_after_seconds(response.headers)
+                )
+                continue
+            break
+        if response.is_error:
+            raise SpotifyException(
+                response.status_code,
+                -1,
+                f"{response.url}:\n {response.text}",
+                headers=response.headers,
+            )
+        self.rate_limiter.succeeded()
+        return response.json()
@@ -1,58 +1,140 @@
+import asyncio
 import spotipy
 import polars as pl
 from loguru import logger
-from typing import List
-from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterator, List
+from dataclasses import dataclass
 from toolz import partition_all
+from .async_client import AsyncSpotify
+from .frame_builder import FrameBuilder
+
+
+TRACK_AUDIO_FEATURES_SCHEMA: Dict[str, pl.PolarsDataType] = {
+    "track_id": pl.Utf8,
+    "acousticness": pl.Float64,
+    "danceability": pl.Float64,
+    "duration_ms": pl.Int64,
+    "energy": pl.Float64,
+    "instrumentalness": pl.Float64,
+    "key": pl.Int64,
+    "liveness": pl.Float64,
+    "loudness": pl.Float64,
+    "mode": pl.Int64,
+    "speechiness": pl.Float64,
+    "tempo": pl.Float64,
+    "time_signature": pl.Int64,
+    "valence": pl.Float64,
+}
+
+# Spotify's field for each column, in schema order.
+_AUDIO_FEATURE_FIELDS = ["id", *list(TRACK_AUDIO_FEATURES_SCHEMA)[1:]]
 
 
 @dataclass
-class TrackAudioFeatures:
-    track_id: str
-    acousticness: float
-    danceability: float
-    duration_ms: int
-    energy: float
-    instrumentalness: float
-    key: int
-    liveness: float
-    loudness: float
-    mode: int
-    speechiness: float
-    tempo: float
-    time_signature: int
-    valence: float
+class AudioFeaturesChunk:
+    track_audio_features: pl.DataFrame
+    # The tracks requested for this chunk, in request order.
+    track_ids: List[str]
+
+
+def _append_audio_features(
+    audio_features_response: List[Dict[str, Any]],
+    all_track_audio_features: FrameBuilder,
+):
+    for track_audio_features in audio_features_response:
+        # Spotify returns null for tracks it has no analysis for.
+        if track_audio_features is None:
+            continue
+        all_track_audio_features.append_fields(
+            track_audio_features, _AUDIO_FEATURE_FIELDS
+        )
+
+
+async def pull_audio_features_async(
+    spotify: AsyncSpotify,
+    track_audio_features_to_pull: List[str],
+    logger=logger,
+) -> pl.DataFrame:
+    track_batches = list(partition_all(100, track_audio_features_to_pull))
+    logger.info(
+        f"Pulling track audio features in {len(track_batches)} batches of "
+        f"100, {spotify.max_concurrency} at a time."
+    )
+    # gather keeps the responses in batch order.
+    audio_features_responses = await asyncio.gather(
+        *[
+            spotify.get("audio-features", ids=",".join(track_batch))
+            for track_batch in track_batches
+        ]
+    )
+    all_track_audio_features = FrameBuilder(TRACK_AUDIO_FEATURES_SCHEMA)
+    for audio_features_response in audio_features_responses:
+        _append_audio_features(
+            audio_features_response["audio_features"],
+            all_track_audio_features,
+        )
+    return all_track_audio_features.build()
 
 
 def pull_audio_features(
     spotify: spotipy.Spotify,
     track_audio_features_to_pull: List[str],
     logger=logger,
+    max_concurrency: int = 1,
 ) -> pl.DataFrame:
+    if max_concurrency > 1:
+        return asyncio.run(
+            _pull_audio_features_concurrently(
+                spotify,
+                track_audio_features_to_pull,
+                max_concurrency,
+                logger=logger,
+            )
+        )
+
     logger.info("Pulling track audio features in batches of 100.")
 
-    all_track_audio_features: List[TrackAudioFeatures] = []
+    all_track_audio_features = FrameBuilder(TRACK_AUDIO_FEATURES_SCHEMA)
     for track_batch in partition_all(100, track_audio_features_to_pull):
         logger.info(f"Pulling audio features for {len(track_batch)} tracks.")
 
         audio_features_response = spotify.audio_features(tracks=track_batch)
-        for track_audio_features in audio_features_response:
-            all_track_audio_features.append(
-                TrackAudioFeatures(
-                    track_id=track_audio_features["id"],
-                    acousticness=track_audio_features["acousticness"],
-                    danceability=track_audio_features["danceability"],
-                    duration_ms=track_audio_features["duration_ms"],
-                    energy=track_audio_features["energy"],
-                    instrumentalness=track_audio_features["instrumentalness"],
-                    key=track_audio_features["key"],
-                    liveness=track_audio_features["liveness"],
-                    loudness=track_audio_features["loudness"],
-                    mode=track_audio_features["mode"],
-                    speechiness=track_audio_features["speechiness"],
-                    tempo=track_audio_features["tempo"],
-                    time_signature=track_audio_features["time_signature"],
-                    valence=track_audio_features["valence"],
-                )
-            )
-    return pl.from_dicts(map(asdict, all_track_audio_features))
+        _append_audio_features(
+            audio_features_response, all_track_audio_features
+        )
+    return all_track_audio_features.build()
+
+
+async def _pull_audio_features_concurrently(
+    spotify: spotipy.Spotify,
+    track_audio_features_to_pull: List[str],
+    max_concurrency: int,
+    logger=logger,
+) -> pl.DataFrame:
+    async with AsyncSpotify(spotify, max_concurrency) as async_spotify:
+        return await pull_audio_features_async(
+            async_spotify, track_audio_features_to_pull, logger=logger
+        )
+
+
+def iter_audio_features(
+    spotify: spotipy.Spotify,
+    track_audio_features_to_pull: List[str],
+    logger=logger,
+    chunk_size: int = 1000,
+    max_concurrency: int = 1,
+) -> Iterator[AudioFeaturesChunk]:
+    """Pulls audio features chunk_size tracks at a time, yielding each
+    chunk as soon as it's pulled.
+    """
+    for track_chunk in partition_all(chunk_size, track_audio_features_to_pull):
+        track_ids = list(track_chunk)
+        yield AudioFeaturesChunk(
+            track_audio_features=pull_audio_features(
+                spotify,
+                track_ids,
+                logger=logger,
+                max_concurrency=max_concurrency,
+            ),
+            track_ids=track_ids,
+        )
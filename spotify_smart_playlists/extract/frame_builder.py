@@ -0,0 +1,34 @@
+import polars as pl
+from typing import Any, Dict, List, Mapping, Sequence
+
+
+class FrameBuilder:
+    """Accumulates rows straight into one list per column of a declared
+    schema and builds the frame in one step at the end.
+
+    No per-row objects and no schema inference, so empty or all-null pulls
+    still come back with the right columns and types.
+    """
+
+    def __init__(self, schema: Dict[str, pl.PolarsDataType]):
+        self.schema = schema
+        self.columns: Dict[str, List[Any]] = {column: [] for column in schema}
+        self._column_lists = list(self.columns.values())
+
+    def __len__(self) -> int:
+        return len(self._column_lists[0])
+
+    def append(self, *values: Any):
+        """Appends a row, values in schema order."""
+        for column, value in zip(self._column_lists, values):
+            column.append(value)
+
+    def append_fields(self, record: Mapping[str, Any], fields: Sequence[str]):
+        """Appends a row from a mapping, fields naming the key to read for
+        each column in schema order.
+        """
+        for column, field in zip(self._column_lists, fields):
+            column.append(record[field])
+
+    def build(self) -> pl.DataFrame:
+        return pl.DataFrame(self.columns, schema=self.schema)
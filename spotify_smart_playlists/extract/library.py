@@ -1,58 +1,203 @@
+import asyncio
 import spotipy
 import polars as pl
-from dataclasses import dataclass, asdict
 from datetime import datetime
-from typing import List, Tuple
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
 from dateutil.parser import parse
 import loguru
+from .async_client import AsyncSpotify
+from .frame_builder import FrameBuilder
 
 
-@dataclass
-class LibraryTrack:
-    date_added: datetime
-    track_id: str
-    track_name: str
+LIBRARY_TRACKS_SCHEMA: Dict[str, pl.PolarsDataType] = {
+    "date_added": pl.Datetime("us"),
+    "track_id": pl.Utf8,
+    "track_name": pl.Utf8,
+}
+
+TRACK_ARTISTS_SCHEMA: Dict[str, pl.PolarsDataType] = {
+    "track_id": pl.Utf8,
+    "artist_id": pl.Utf8,
+}
 
 
 @dataclass
-class TrackArtist:
-    track_id: str
-    artist_id: str
+class LibraryTracksChunk:
+    library_tracks: pl.DataFrame
+    track_artists: pl.DataFrame
+    # Offset of the first library track after this chunk.
+    next_offset: int
+
+
+def get_library_track_count(spotify: spotipy.Spotify) -> int:
+    # One track is enough, the total comes back with every page.
+    return spotify.current_user_saved_tracks(limit=1)["total"]
+
+
+def _append_library_page(
+    library_tracks_response: Dict[str, Any],
+    library_tracks: FrameBuilder,
+    track_artists: FrameBuilder,
+    added_since: datetime | None = None,
+) -> bool:
+    """Appends a page of saved tracks, returns False once added_since is
+    reached and paging should stop.
+    """
+    for track in library_tracks_response["items"]:
+        date_added = parse(track["added_at"]).replace(tzinfo=None)
+        # Saved tracks come back newest first, so the first track older
+        # than the cutoff means everything after it is already stored.
+        # Tracks added at exactly the cutoff are kept - they're merged
+        # on track_id so re-pulling them is harmless.
+        if added_since is not None and date_added < added_since:
+            return False
+        track_id = track["track"]["id"]
+        library_tracks.append(date_added, track_id, track["track"]["name"])
+        for artist in track["track"]["artists"]:
+            track_artists.append(track_id, artist["id"])
+    return True
+
+
+async def _pull_library_pages(
+    spotify: AsyncSpotify, offsets: Sequence[int], page_size: int
+) -> List[Dict[str, Any]]:
+    # gather keeps the pages in offset order, i.e. library order.
+    return await asyncio.gather(
+        *[
+            spotify.get("me/tracks", limit=page_size, offset=offset)
+            for offset in offsets
+        ]
+    )
+
+
+async def _pull_library_pages_concurrently(
+    spotify: spotipy.Spotify,
+    offsets: Sequence[int],
+    page_size: int,
+    max_concurrency: int,
+) -> List[Dict[str, Any]]:
+    async with AsyncSpotify(spotify, max_concurrency) as async_spotify:
+        return await _pull_library_pages(async_spotify, offsets, page_size)
+
+
+async def pull_library_tracks_async(
+    spotify: AsyncSpotify, page_size: int = 50, logger=loguru.logger
+) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    library_tracks_response = await spotify.get("me/tracks", limit=page_size)
+    total = library_tracks_response["total"]
+    # The first page tells us how many there are, so every other offset is
+    # known up front and the pages can be requested all at once.
+    offsets = range(page_size, total, page_size)
+    logger.info(
+        f"Pulling {total} library tracks in {len(offsets) + 1} pages, "
+        f"{spotify.max_concurrency} at a time."
+    )
+    library_tracks_pages = await _pull_library_pages(
+        spotify, offsets, page_size
+    )
+
+    library_tracks = FrameBuilder(LIBRARY_TRACKS_SCHEMA)
+    track_artists = FrameBuilder(TRACK_ARTISTS_SCHEMA)
+    for page in [library_tracks_response, *library_tracks_pages]:
+        _append_library_page(page, library_tracks, track_artists)
+    logger.info(f"Found {len(library_tracks)} tracks in total.")
+    return library_tracks.build(), track_artists.build()
+
+
+async def _pull_library_tracks_concurrently(
+    spotify: spotipy.Spotify, max_concurrency: int, logger=loguru.logger
+) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    async with AsyncSpotify(spotify, max_concurrency) as async_spotify:
+        return await pull_library_tracks_async(async_spotify, logger=logger)
 
 
 def pull_library_tracks(
-    spotify: spotipy.Spotify, logger=loguru.logger
+    spotify: spotipy.Spotify,
+    logger=loguru.logger,
+    added_since: datetime | None = None,
+    max_concurrency: int = 1,
 ) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    """Pulls the saved tracks in the user's library.
+
+    With added_since, paging stops at the first track added before it.
+    Otherwise with max_concurrency > 1 the pages are fetched concurrently
+    by offset instead of following the next links one at a time.
+    """
+    if added_since is None and max_concurrency > 1:
+        return asyncio.run(
+            _pull_library_tracks_concurrently(
+                spotify, max_concurrency, logger=logger
+            )
+        )
+
     logger.info("Calling Spotify for library tracks.")
+    if added_since is not None:
+        logger.info(f"Only pulling tracks added since {added_since}.")
     library_tracks_response = spotify.current_user_saved_tracks(limit=50)
 
-    library_tracks: List[LibraryTrack] = []
-    track_artists: List[TrackArtist] = []
+    library_tracks = FrameBuilder(LIBRARY_TRACKS_SCHEMA)
+    track_artists = FrameBuilder(TRACK_ARTISTS_SCHEMA)
     while library_tracks_response:
-        for track in library_tracks_response["items"]:
-            library_tracks.append(
-                LibraryTrack(
-                    date_added=parse(track["added_at"]).replace(tzinfo=None),
-                    track_id=track["track"]["id"],
-                    track_name=track["track"]["name"],
-                )
-            )
-            for artist in track["track"]["artists"]:
-                track_artists.append(
-                    TrackArtist(
-                        track_id=track["track"]["id"], artist_id=artist["id"]
-                    )
-                )
+        if not _append_library_page(
+            library_tracks_response,
+            library_tracks,
+            track_artists,
+            added_since=added_since,
+        ):
+            break
         logger.info(
             "Calling Spotify for library tracks: "
             f"{len(library_tracks)} pulled so far."
         )
         library_tracks_response = spotify.next(library_tracks_response)
     logger.info(f"Found {len(library_tracks)} tracks in total.")
-    library_tracks_frame = pl.from_dicts(
-        map(lambda x: asdict(x), library_tracks)
-    )
-    track_artists_frame = pl.from_dicts(
-        map(lambda x: asdict(x), track_artists)
+    return library_tracks.build(), track_artists.build()
+
+
+def iter_library_tracks(
+    spotify: spotipy.Spotify,
+    logger=loguru.logger,
+    chunk_size: int = 1000,
+    offset: int = 0,
+    max_concurrency: int = 1,
+    page_size: int = 50,
+) -> Iterator[LibraryTracksChunk]:
+    """Pulls the library in chunks of roughly chunk_size tracks, starting
+    at offset, so callers can write each chunk out as it arrives instead of
+    holding the whole library in memory.
+    """
+    total = get_library_track_count(spotify)
+    logger.info(
+        f"Pulling {total - offset} of {total} library tracks in chunks "
+        f"of {chunk_size}."
     )
-    return library_tracks_frame, track_artists_frame
+    while offset < total:
+        offsets = range(offset, min(offset + chunk_size, total), page_size)
+        if max_concurrency > 1:
+            pages = asyncio.run(
+                _pull_library_pages_concurrently(
+                    spotify, offsets, page_size, max_concurrency
+                )
+            )
+        else:
+            pages = [
+                spotify.current_user_saved_tracks(
+                    limit=page_size, offset=page_offset
+                )
+                for page_offset in offsets
+            ]
+        library_tracks = FrameBuilder(LIBRARY_TRACKS_SCHEMA)
+        track_artists = FrameBuilder(TRACK_ARTISTS_SCHEMA)
+        for page in pages:
+            _append_library_page(page, library_tracks, track_artists)
+        offset = offsets[-1] + page_size
+        logger.info(
+            "Calling Spotify for library tracks: "
+            f"{min(offset, total)} of {total} pulled so far."
+        )
+        yield LibraryTracksChunk(
+            library_tracks=library_tracks.build(),
+            track_artists=track_artists.build(),
+            next_offset=offset,
+        )
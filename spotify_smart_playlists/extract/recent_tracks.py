@@ -1,50 +1,122 @@
 import spotipy
 import polars as pl
 import loguru
-from datetime import datetime
-from dataclasses import dataclass, asdict
-from typing import List
-from toolz import get
-from dateutil.parser import parse
+from datetime import datetime, timezone
+from typing import Any, Dict
+from toolz import get, get_in
+from .async_client import AsyncSpotify
+from .frame_builder import FrameBuilder
 
 
-@dataclass
-class TrackPlay:
-    track_id: str
-    played_at: datetime
+TRACK_PLAYS_SCHEMA: Dict[str, pl.PolarsDataType] = {
+    "track_id": pl.Utf8,
+    "played_at": pl.Datetime("us"),
+}
 
+# played_at comes over as an ISO 8601 string in UTC and is kept as text until
+# the whole pull is parsed in one go.
+_RAW_TRACK_PLAYS_SCHEMA: Dict[str, pl.PolarsDataType] = {
+    "track_id": pl.Utf8,
+    "played_at": pl.Utf8,
+}
+_PLAYED_AT_FORMAT = "%Y-%m-%dT%H:%M:%S%.fZ"
 
-def pull_recent_tracks(
-    spotify: spotipy.Spotify,
-    max_played_at: datetime | None,
-    logger=loguru.logger,
-) -> pl.DataFrame | None:
-    logger.info("Getting most recently played tracks.")
-    recent_tracks_response = spotify.current_user_recently_played()
 
+def _after_cursor(max_played_at: datetime | None) -> int | None:
+    """Converts the stored high-water mark into the unix milliseconds
+    Spotify's `after` cursor takes.
+    """
     if not max_played_at:
-        max_played_at = datetime(
-            year=1970, month=1, day=1, hour=0, minute=0, second=0
-        )
+        return None
+    # Stored timestamps are naive UTC.
+    return int(max_played_at.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
 
-    recent_tracks: List[TrackPlay] = []
+def _append_recent_tracks_page(
+    recent_tracks_response: Dict[str, Any], recent_tracks: FrameBuilder
+):
     for recent_track in get("items", recent_tracks_response, []):
-        # Strip the time zone out. We don't store it in the db cause it's
-        # absolute hell to deal with. It's in UTC as it comes in so just
-        # rip it off.
-        played_at = parse(recent_track["played_at"]).replace(tzinfo=None)
-        if played_at > max_played_at:
-            recent_tracks.append(
-                TrackPlay(
-                    track_id=recent_track["track"]["id"],
-                    played_at=played_at,
-                )
-            )
-    if recent_tracks:
-        logger.info(f"Found {len(recent_tracks)} new track plays.")
-        return pl.from_dicts(map(asdict, recent_tracks)).select(
-            pl.col("track_id"), pl.col("played_at")
+        recent_tracks.append(
+            recent_track["track"]["id"], recent_track["played_at"]
+        )
+
+
+def _next_after_cursor(
+    recent_tracks_response: Dict[str, Any], after: int | None
+) -> int | None:
+    """Returns the cursor for the next page, or None when the pull is done."""
+    if not recent_tracks_response.get("next"):
+        return None
+    next_after = get_in(["cursors", "after"], recent_tracks_response)
+    # Guard against a cursor that doesn't move so we can't loop forever.
+    if next_after is None or int(next_after) <= (after or 0):
+        return None
+    return int(next_after)
+
+
+def _recent_tracks_frame(
+    recent_tracks: FrameBuilder,
+    max_played_at: datetime | None,
+    logger=loguru.logger,
+) -> pl.DataFrame | None:
+    # The time zone isn't stored in the db cause it's absolute hell to deal
+    # with. It's in UTC as it comes in so the format just drops the Z.
+    recent_tracks_frame = recent_tracks.build().with_columns(
+        pl.col("played_at").str.strptime(
+            pl.Datetime("us"), fmt=_PLAYED_AT_FORMAT
+        )
+    )
+    # The cursor is millisecond resolution, so this only ever drops the
+    # boundary play.
+    if max_played_at:
+        recent_tracks_frame = recent_tracks_frame.filter(
+            pl.col("played_at") > max_played_at
         )
+    recent_tracks_frame = recent_tracks_frame.unique().sort("played_at")
+    if not recent_tracks_frame.is_empty():
+        logger.info(f"Found {recent_tracks_frame.shape[0]} new track plays.")
+        return recent_tracks_frame
     else:
         logger.info("No new track plays.")
         return None
+
+
+async def pull_recent_tracks_async(
+    spotify: AsyncSpotify,
+    max_played_at: datetime | None,
+    logger=loguru.logger,
+) -> pl.DataFrame | None:
+    logger.info("Getting most recently played tracks.")
+    recent_tracks = FrameBuilder(_RAW_TRACK_PLAYS_SCHEMA)
+    after = _after_cursor(max_played_at)
+    while True:
+        params: Dict[str, Any] = {"limit": 50}
+        if after is not None:
+            params["after"] = after
+        recent_tracks_response = await spotify.get(
+            "me/player/recently-played", **params
+        )
+        _append_recent_tracks_page(recent_tracks_response, recent_tracks)
+        after = _next_after_cursor(recent_tracks_response, after)
+        if after is None:
+            break
+    return _recent_tracks_frame(recent_tracks, max_played_at, logger=logger)
+
+
+def pull_recent_tracks(
+    spotify: spotipy.Spotify,
+    max_played_at: datetime | None,
+    logger=loguru.logger,
+) -> pl.DataFrame | None:
+    logger.info("Getting most recently played tracks.")
+    recent_tracks = FrameBuilder(_RAW_TRACK_PLAYS_SCHEMA)
+    after = _after_cursor(max_played_at)
+    while True:
+        recent_tracks_response = spotify.current_user_recently_played(
+            limit=50, after=after
+        )
+        _append_recent_tracks_page(recent_tracks_response, recent_tracks)
+        after = _next_after_cursor(recent_tracks_response, after)
+        if after is None:
+            break
+    return _recent_tracks_frame(recent_tracks, max_played_at, logger=logger)
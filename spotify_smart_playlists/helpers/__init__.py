@@ -4,10 +4,24 @@ from .auth import (
     SpotifyCredentials,
     get_spotify_credentials_from_environment,
 )
+from .rate_limit import (
+    RateLimiter,
+    RateLimitBudget,
+    RateLimitedSpotify,
+    get_rate_limiter,
+    retry_after_seconds,
+)
+from .poll import AdaptivePollInterval
 
 __all__ = [
     "DuckDBEncryptedCacheHandler",
     "spotify_auth",
     "SpotifyCredentials",
     "get_spotify_credentials_from_environment",
+    "RateLimiter",
+    "RateLimitBudget",
+    "RateLimitedSpotify",
+    "get_rate_limiter",
+    "retry_after_seconds",
+    "AdaptivePollInterval",
 ]
@@ -0,0 +1,55 @@
+class AdaptivePollInterval:
+    """Sizes the gap between recent-tracks polls from the listening rate.
+
+    Spotify only keeps the last `window` plays, so the interval is set so
+    that at the observed rate only `headroom` of the window fills up between
+    polls. Polls that find nothing back off towards max_interval so an idle
+    account is barely touched, and a poll that comes back with a full window
+    (plays were probably lost) drops straight to min_interval.
+    """
+
+    def __init__(
+        self,
+        window: int = 50,
+        headroom: float = 0.5,
+        min_interval: float = 60.0,
+        max_interval: float = 1800.0,
+        idle_backoff: float = 2.0,
+        smoothing: float = 0.3,
+    ):
+        self.window = window
+        self.headroom = headroom
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_backoff = idle_backoff
+        self.smoothing = smoothing
+        # Plays per second, smoothed across polls.
+        self.rate: float | None = None
+        self.interval = min_interval
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def observe(self, plays: int, elapsed: float) -> float:
+        """Records the plays a poll found over the elapsed seconds since the
+        previous one and returns how long to wait before the next poll.
+        An elapsed of zero (nothing to measure from) leaves the rate alone.
+        """
+        if elapsed > 0:
+            observed_rate = plays / elapsed
+            self.rate = (
+                observed_rate
+                if self.rate is None
+                else self.smoothing * observed_rate
+                + (1 - self.smoothing) * self.rate
+            )
+
+        if plays >= self.window:
+            self.interval = self.min_interval
+        elif plays == 0:
+            self.interval = self._clamp(self.interval * self.idle_backoff)
+        elif self.rate:
+            self.interval = self._clamp(
+                self.headroom * self.window / self.rate
+            )
+        return self.interval
@@ -0,0 +1,189 @@
+import asyncio
+import requests
+import spotipy
+import threading
+import time
+import urllib3
+from dataclasses import dataclass
+from loguru import logger
+from spotipy import SpotifyException
+from typing import Any, Mapping
+
+
+@dataclass
+class RateLimitBudget:
+    # Requests per second the limiter is currently allowing.
+    rate: float
+    # Requests that can go out right now without waiting.
+    available: float
+    # Seconds left on the pause from the last Retry-After, if any.
+    blocked_for: float
+    throttled_count: int
+
+
+class RateLimiter:
+    """Token bucket that every Spotify call in the process draws from.
+
+    The rate adapts: each 429 cuts it in half and pauses everyone until
+    Retry-After has passed, and each successful call nudges it back up
+    towards max_rate. That keeps overlapping flows sharing a client id
+    close to Spotify's real limit instead of bursting into lockouts.
+    """
+
+    def __init__(
+        self,
+        max_rate: float = 10.0,
+        burst: int = 20,
+        min_rate: float = 0.5,
+        backoff: float = 0.5,
+        recovery: float = 0.1,
+    ):
+        self.max_rate = max_rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.backoff = backoff
+        self.recovery = recovery
+        self.rate = max_rate
+        self.throttled_count = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Takes a token and returns how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Tokens can go negative - that's the queue of callers already
+            # waiting, and the wait grows with it.
+            self._tokens -= 1
+            return max(
+                0.0, -self._tokens / self.rate, self._blocked_until - now
+            )
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.recovery)
+
+    def throttled(self, retry_after: float | None = None):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.throttled_count += 1
+            self.rate = max(self.min_rate, self.rate * self.backoff)
+            if retry_after is None:
+                retry_after = 1 / self.rate
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+            # Anything banked before the 429 is clearly not there.
+            self._tokens = min(self._tokens, 0.0)
+        logger.warning(
+            f"Rate limited by Spotify, pausing {retry_after:.1f}s and "
+            f"dropping to {self.rate:.2f} requests/s."
+        )
+
+    @property
+    def budget(self) -> RateLimitBudget:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return RateLimitBudget(
+                rate=self.rate,
+                available=max(0.0, self._tokens),
+                blocked_for=max(0.0, self._blocked_until - now),
+                throttled_count=self.throttled_count,
+            )
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    return _rate_limiter
+
+
+def retry_after_seconds(headers: Mapping[str, Any] | None) -> float | None:
+    if not headers:
+        return None
+    retry_after = headers.get("Retry-After")
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimitedSpotify(spotipy.Spotify):
+    """spotipy client that sends every call through the shared limiter.
+
+    429s are taken out of spotipy's own retries (which sleep per client and
+    compound across flows) and handled here against the shared limiter
+    instead. Other server errors still get spotipy's retries.
+    """
+
+    def __init__(
+        self,
+        *args,
+        rate_limiter: RateLimiter | None = None,
+        max_throttled_retries: int = 5,
+        **kwargs,
+    ):
+        kwargs.setdefault("status_forcelist", (500, 502, 503, 504))
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.max_throttled_retries = max_throttled_retries
+
+    def _build_session(self):
+        # As spotipy builds it, except urllib3 would otherwise still retry
+        # any 429 that carries a Retry-After, forcelist or not.
+        self._session = requests.Session()
+        retry = urllib3.Retry(
+            total=self.retries,
+            connect=None,
+            read=False,
+            allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+            status=self.status_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.status_forcelist,
+            respect_retry_after_header=False,
+        )
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _internal_call(self, method, url, payload, params):
+        throttled = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                # spotipy pops keys out of params, so each attempt gets its
+                # own copy.
+                results = super()._internal_call(
+                    method, url, payload, dict(params)
+                )
+            except SpotifyException as e:
+                if (
+                    e.http_status != 429
+                    or throttled >= self.max_throttled_retries
+                ):
+                    raise
+                throttled += 1
+                self.rate_limiter.throttled(retry_after_seconds(e.headers))
+                continue
+            self.rate_limiter.succeeded()
+            return results
@@ -1,23 +1,65 @@
 from .root_playlist import (
+    AUDIO_FEATURES,
     playlist_config_from_dict,
     make_root_playlist,
+    make_root_playlists,
     PlaylistConfig,
+    RotationConfig,
+)
+from .rule_engine import (
+    TrackFactsSnapshot,
+    load_track_facts_snapshot,
+    evaluate_playlist,
+    evaluate_playlists,
+)
+from .rotation import (
+    RotationSnapshot,
+    load_rotation_snapshot,
+    rotation_weights,
+    select_rotations,
+)
+from .clustering import (
+    ClusterModel,
+    fit_cluster_model,
+    assign_clusters,
+)
+from .recommender import (
+    AudioFeatureIndex,
+    load_audio_feature_index,
+    recommend_tracks,
 )
 from .smart_playlist import (
     get_recommended_tracks,
-    get_playlist_from_spotify,
-    get_tracks_for_playlist,
+    get_playlist_index,
+    get_tracks_for_playlists,
     create_playlist_on_spotify,
     load_playlist_to_spotify,
 )
 
 __all__ = [
+    "AUDIO_FEATURES",
     "playlist_config_from_dict",
     "make_root_playlist",
+    "make_root_playlists",
     "PlaylistConfig",
+    "RotationConfig",
+    "TrackFactsSnapshot",
+    "load_track_facts_snapshot",
+    "evaluate_playlist",
+    "evaluate_playlists",
+    "RotationSnapshot",
+    "load_rotation_snapshot",
+    "rotation_weights",
+    "select_rotations",
+    "ClusterModel",
+    "fit_cluster_model",
+    "assign_clusters",
+    "AudioFeatureIndex",
+    "load_audio_feature_index",
+    "recommend_tracks",
     "get_recommended_tracks",
-    "get_playlist_from_spotify",
-    "get_tracks_for_playlist",
+    "get_playlist_index",
+    "get_tracks_for_playlists",
     "create_playlist_on_spotify",
     "load_playlist_to_spotify",
 ]
@@ -0,0 +1,142 @@
+import numpy as np
+from dataclasses import dataclass
+from loguru import logger
+from typing import List
+
+
+@dataclass
+class ClusterModel:
+    """k-means centroids over standardized audio features, with the scaling
+    they were fit with so tracks seen later land in the same space.
+
+    requested_clusters is the number of clusters asked for, there are fewer
+    centroids when there were fewer tracks than that.
+    """
+
+    features: List[str]
+    mean: np.ndarray
+    scale: np.ndarray
+    centroids: np.ndarray
+    names: List[str]
+    requested_clusters: int
+
+    def standardize(self, vectors: np.ndarray) -> np.ndarray:
+        return (vectors - self.mean) / self.scale
+
+
+def nearest_centroids(
+    vectors: np.ndarray, centroids: np.ndarray, block_size: int = 8192
+) -> np.ndarray:
+    """Index of the closest centroid for every row of vectors, computed a
+    block of rows at a time.
+    """
+    labels = np.empty(vectors.shape[0], dtype=np.int64)
+    # |x|^2 is the same for every centroid, so it can't change the argmin.
+    centroid_norms = (centroids**2).sum(axis=1)
+    for start in range(0, vectors.shape[0], block_size):
+        block = vectors[start : start + block_size]
+        labels[start : start + block_size] = np.argmin(
+            centroid_norms[None, :] - 2 * block @ centroids.T, axis=1
+        )
+    return labels
+
+
+def _kmeans_plus_plus(
+    vectors: np.ndarray, num_clusters: int, rng: np.random.Generator
+) -> np.ndarray:
+    centroids = [vectors[rng.integers(vectors.shape[0])]]
+    distances = ((vectors - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, num_clusters):
+        total = distances.sum()
+        # Every point sits on a centroid already, any of them will do.
+        choice = (
+            rng.choice(vectors.shape[0], p=distances / total)
+            if total > 0
+            else rng.integers(vectors.shape[0])
+        )
+        centroids.append(vectors[choice])
+        distances = np.minimum(
+            distances, ((vectors - vectors[choice]) ** 2).sum(axis=1)
+        )
+    return np.array(centroids)
+
+
+def _cluster_name(
+    number: int, centroid: np.ndarray, features: List[str]
+) -> str:
+    # Named for the two features that stand out most from the library
+    # average, e.g. "Auto 3: high energy, low acousticness".
+    standouts = np.argsort(-np.abs(centroid), kind="stable")[:2]
+    descriptions = [
+        ("high " if centroid[i] > 0 else "low ")
+        + features[i].removesuffix("_ms").replace("_", " ")
+        for i in standouts
+    ]
+    return f"Auto {number}: {', '.join(descriptions)}"
+
+
+def fit_cluster_model(
+    vectors: np.ndarray,
+    features: List[str],
+    num_clusters: int,
+    batch_size: int = 1024,
+    iterations: int = 200,
+    init_sample_size: int = 10_000,
+    rng: np.random.Generator | None = None,
+    logger=logger,
+) -> ClusterModel:
+    """Mini-batch k-means over the rows of vectors (one column per
+    feature).
+
+    Each step assigns a random batch to its nearest centroids and moves
+    every centroid to the running mean of all the points it has been
+    given, so a centroid's learning rate falls as it settles.
+    """
+    rng = rng or np.random.default_rng()
+    mean = vectors.mean(axis=0)
+    scale = vectors.std(axis=0)
+    scale = np.where(scale > 0, scale, 1.0)
+    standardized = (vectors - mean) / scale
+    requested_clusters = num_clusters
+    num_clusters = min(num_clusters, standardized.shape[0])
+
+    init_sample = standardized[
+        rng.choice(
+            standardized.shape[0],
+            min(init_sample_size, standardized.shape[0]),
+            replace=False,
+        )
+    ]
+    centroids = _kmeans_plus_plus(init_sample, num_clusters, rng)
+    counts = np.zeros(num_clusters)
+    for _ in range(iterations):
+        batch = standardized[
+            rng.integers(standardized.shape[0], size=batch_size)
+        ]
+        labels = nearest_centroids(batch, centroids)
+        batch_counts = np.bincount(labels, minlength=num_clusters)
+        batch_sums = np.zeros_like(centroids)
+        np.add.at(batch_sums, labels, batch)
+        counts += batch_counts
+        moved = batch_counts > 0
+        centroids[moved] += (
+            batch_sums[moved] - batch_counts[moved, None] * centroids[moved]
+        ) / counts[moved, None]
+    logger.info(
+        f"Fit {num_clusters} clusters to {standardized.shape[0]} tracks."
+    )
+    return ClusterModel(
+        features=features,
+        mean=mean,
+        scale=scale,
+        centroids=centroids,
+        names=[
+            _cluster_name(i + 1, centroid, features)
+            for i, centroid in enumerate(centroids)
+        ],
+        requested_clusters=requested_clusters,
+    )
+
+
+def assign_clusters(model: ClusterModel, vectors: np.ndarray) -> np.ndarray:
+    return nearest_centroids(model.standardize(vectors), model.centroids)
@@ -0,0 +1,119 @@
+import numpy as np
+from dataclasses import dataclass
+from duckdb import DuckDBPyConnection
+from loguru import logger
+from typing import Dict, Iterable, List
+from .root_playlist import AUDIO_FEATURES
+
+
+@dataclass
+class AudioFeatureIndex:
+    """Library tracks' audio features scaled to zero mean and unit variance,
+    so no one feature (looking at you, duration_ms) dominates distances.
+    Days since each track was last played ride along (NaN if never) so
+    tracks cooling down can be skipped.
+    """
+
+    track_ids: np.ndarray
+    vectors: np.ndarray
+    squared_norms: np.ndarray
+    positions: Dict[str, int]
+    days_since_played: np.ndarray
+
+    def __len__(self) -> int:
+        return self.track_ids.shape[0]
+
+
+def load_audio_feature_index(
+    database: DuckDBPyConnection,
+) -> AudioFeatureIndex:
+    # Tracks missing any feature can't be placed, so they're left out.
+    features = database.sql(
+        f"""
+        SELECT
+            track_facts.track_id,
+            {", ".join(AUDIO_FEATURES)},
+            DATE_DIFF('day', tlp.last_played_at, CURRENT_DATE)::DOUBLE
+                AS days_since_played
+        FROM track_facts
+        LEFT JOIN track_last_played AS tlp
+            ON track_facts.track_id = tlp.track_id
+        WHERE {" AND ".join(f"{f} IS NOT NULL" for f in AUDIO_FEATURES)}
+        ORDER BY track_facts.track_id
+        """
+    ).pl()
+    track_ids = features.get_column("track_id").to_numpy()
+    vectors = features.select(AUDIO_FEATURES).to_numpy().astype(np.float64)
+    scale = vectors.std(axis=0)
+    vectors = (vectors - vectors.mean(axis=0)) / np.where(
+        scale > 0, scale, 1.0
+    )
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    return AudioFeatureIndex(
+        track_ids=track_ids,
+        vectors=vectors,
+        squared_norms=(vectors**2).sum(axis=1),
+        positions={
+            track_id: i for i, track_id in enumerate(track_ids.tolist())
+        },
+        days_since_played=features.get_column("days_since_played")
+        .fill_null(np.nan)
+        .to_numpy(),
+    )
+
+
+def recommend_tracks(
+    index: AudioFeatureIndex,
+    seed_tracks: List[str],
+    num_tracks: int,
+    exclude: Iterable[str] = (),
+    cooldown_days: int | None = None,
+    block_size: int = 4096,
+    logger=logger,
+) -> List[str]:
+    """Returns the num_tracks library tracks closest to any of the seed
+    tracks, nearest first, leaving out the seeds, anything in exclude and,
+    given cooldown_days, anything played within that many days.
+
+    The search is brute force over blocks of the index, so memory stays at
+    block_size x seeds no matter how big the library gets.
+    """
+    seed_positions = [
+        index.positions[t] for t in seed_tracks if t in index.positions
+    ]
+    if not seed_positions or num_tracks <= 0:
+        logger.info("No seed tracks with audio features to recommend from.")
+        return []
+    seeds = index.vectors[seed_positions]
+    seed_norms = index.squared_norms[seed_positions]
+
+    distances = np.empty(len(index), dtype=np.float32)
+    for start in range(0, len(index), block_size):
+        block = slice(start, start + block_size)
+        # |x - s|^2 = |x|^2 - 2 x.s + |s|^2, closest seed only.
+        block_distances = (
+            index.squared_norms[block, None]
+            - 2 * index.vectors[block] @ seeds.T
+            + seed_norms[None, :]
+        )
+        distances[block] = block_distances.min(axis=1)
+
+    excluded = [
+        index.positions[t]
+        for t in [*seed_tracks, *exclude]
+        if t in index.positions
+    ]
+    distances[excluded] = np.inf
+    if cooldown_days is not None:
+        distances[index.days_since_played <= cooldown_days] = np.inf
+    candidates = np.flatnonzero(np.isfinite(distances))
+    num_tracks = min(num_tracks, candidates.shape[0])
+    if not num_tracks:
+        return []
+    nearest = candidates[
+        np.argpartition(distances[candidates], num_tracks - 1)[:num_tracks]
+    ]
+    nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+    recommended_tracks = index.track_ids[nearest].tolist()
+    logger.info(f"Recommended {len(recommended_tracks)} similar tracks.")
+    return recommended_tracks
@@ -1,4 +1,4 @@
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, asdict, field, fields
 from duckdb import DuckDBPyConnection
 from loguru import logger
 import polars as pl
@@ -29,6 +29,40 @@ class AudioFeaturesConfig:
     valence: AudioFeatureConfig | None = None
 
 
+@dataclass
+class PlayCountConfig:
+    min: int | None = None
+    max: int | None = None
+    # Only count plays from the last `days` days, all time if unset.
+    days: int | None = None
+
+
+@dataclass
+class PlayStatsConfig:
+    play_count: PlayCountConfig | None = None
+    # Tracks not played in this many days, including never played.
+    not_played_in_days: int | None = None
+    # Tracks saved to the library in the last this many days.
+    added_in_days: int | None = None
+    # The this many most played tracks since the start of the month.
+    most_played_this_month: int | None = None
+
+
+@dataclass
+class RotationConfig:
+    # Tracks played in the last this many days are never rotated in.
+    cooldown_days: int = 14
+    # Weight tracks by (days since last played) ** recency_weight. Never
+    # played tracks count from when they were saved.
+    recency_weight: float = 0.0
+    # Weight tracks by 1 / (1 + play count) ** rarity_weight.
+    rarity_weight: float = 0.0
+    # Multiply the weight of tracks saved in the last freshness_days days by
+    # 1 + freshness_boost.
+    freshness_boost: float = 0.0
+    freshness_days: int = 30
+
+
 @dataclass
 class TrackConfig:
     name: str
@@ -40,6 +74,8 @@ class TrackConfig:
 class PlaylistConfig:
     name: str
     audio_features: AudioFeaturesConfig | None = None
+    play_stats: PlayStatsConfig | None = None
+    rotation: RotationConfig = field(default_factory=RotationConfig)
     genres: List[str] = field(default_factory=list)
     artists: List[str] = field(default_factory=list)
     additional_tracks: List[TrackConfig] = field(default_factory=list)
@@ -58,6 +94,17 @@ def playlist_config_from_dict(
                 ].items()
             }
         )
+    play_stats_config: PlayStatsConfig | None = None
+    if "play_stats" in playlist_config_dict:
+        play_stats_dict = dict(playlist_config_dict["play_stats"])
+        if "play_count" in play_stats_dict:
+            play_stats_dict["play_count"] = PlayCountConfig(
+                **play_stats_dict["play_count"]
+            )
+        play_stats_config = PlayStatsConfig(**play_stats_dict)
+    rotation_config = RotationConfig(
+        **get("rotation", playlist_config_dict, {})
+    )
     additional_tracks: List[TrackConfig] = [
         TrackConfig(**tc)
         for tc in get("additional_tracks", playlist_config_dict, [])
@@ -65,28 +112,14 @@ def playlist_config_from_dict(
     return PlaylistConfig(
         name=playlist_config_dict["name"],
         audio_features=audio_features_config,
+        play_stats=play_stats_config,
+        rotation=rotation_config,
         genres=get("genres", playlist_config_dict, []),
         artists=get("artists", playlist_config_dict, []),
         additional_tracks=additional_tracks,
     )
 
 
-def audio_feature_where(audio_features: AudioFeaturesConfig) -> str:
-    clauses: List[str] = []
-    for audio_feature, audio_feature_config in asdict(audio_features).items():
-        if audio_feature_config is None:
-            continue
-        if audio_feature_config["min"] is not None:
-            clauses.append(
-                f"({audio_feature} >= {audio_feature_config['min']})"
-            )
-        if audio_feature_config["max"] is not None:
-            clauses.append(
-                f"({audio_feature} <= {audio_feature_config['max']})"
-            )
-    return " AND ".join(clauses)
-
-
 def additional_tracks(
     database: DuckDBPyConnection, additional_tracks: List[TrackConfig]
 ) -> pl.DataFrame:
@@ -112,62 +145,164 @@ def additional_tracks(
     ).pl()
 
 
-def make_root_playlist(
-    database: DuckDBPyConnection,
-    playlist_config: PlaylistConfig,
-    logger=logger,
+AUDIO_FEATURES = [f.name for f in fields(AudioFeaturesConfig)]
+
+PLAY_STATS_RULES = [
+    "play_count_min",
+    "play_count_max",
+    "play_count_days",
+    "not_played_in_days",
+    "added_in_days",
+    "most_played_this_month",
+]
+
+PLAYLIST_RULES_SCHEMA: Dict[str, pl.PolarsDataType] = {
+    "name": pl.Utf8,
+    "genres": pl.List(pl.Utf8),
+    "artists": pl.List(pl.Utf8),
+    **{
+        f"{audio_feature}_{bound}": pl.Float64
+        for audio_feature in AUDIO_FEATURES
+        for bound in ["min", "max"]
+    },
+    **{rule: pl.Int32 for rule in PLAY_STATS_RULES},
+}
+
+
+def playlist_rules_frame(
+    playlist_configs: List[PlaylistConfig],
 ) -> pl.DataFrame:
-    genres_filter: str = ""
-    if playlist_config.genres:
-        genres_filter_list = ", ".join(
-            map(lambda x: f"'{x}'", playlist_config.genres)
+    """Flattens playlist configs into one row each, with NULL for any
+    criterion a config doesn't set, for ROOT_PLAYLISTS_QUERY to join
+    against.
+    """
+    rules: Dict[str, List[Any]] = {
+        column: [] for column in PLAYLIST_RULES_SCHEMA
+    }
+    for playlist_config in playlist_configs:
+        rules["name"].append(playlist_config.name)
+        rules["genres"].append(playlist_config.genres or None)
+        rules["artists"].append(playlist_config.artists or None)
+        for audio_feature in AUDIO_FEATURES:
+            audio_feature_config = (
+                getattr(playlist_config.audio_features, audio_feature)
+                if playlist_config.audio_features is not None
+                else None
+            )
+            for bound in ["min", "max"]:
+                rules[f"{audio_feature}_{bound}"].append(
+                    getattr(audio_feature_config, bound)
+                    if audio_feature_config is not None
+                    else None
+                )
+        play_stats = playlist_config.play_stats or PlayStatsConfig()
+        play_count = play_stats.play_count or PlayCountConfig()
+        rules["play_count_min"].append(play_count.min)
+        rules["play_count_max"].append(play_count.max)
+        rules["play_count_days"].append(play_count.days)
+        rules["not_played_in_days"].append(play_stats.not_played_in_days)
+        rules["added_in_days"].append(play_stats.added_in_days)
+        rules["most_played_this_month"].append(
+            play_stats.most_played_this_month
         )
-        genres_filter = f"artist_genres.genre IN ({genres_filter_list})"
+    return pl.DataFrame(rules, schema=PLAYLIST_RULES_SCHEMA)
 
-    artists_filter: str = ""
-    if playlist_config.artists:
-        artists_filter_list = ", ".join(
-            map(lambda x: f"'{x}'", playlist_config.artists)
-        )
-        artists_filter = f"artists.name IN ({artists_filter_list})"
 
-    audio_features_filter: str = ""
-    if playlist_config.audio_features is not None:
-        audio_features_filter = audio_feature_where(
-            playlist_config.audio_features
-        )
+_AUDIO_FEATURE_PREDICATES = " AND\n".join(
+    f"""(rules.{audio_feature}_min IS NULL OR
+        track_facts.{audio_feature} >= rules.{audio_feature}_min) AND
+    (rules.{audio_feature}_max IS NULL OR
+        track_facts.{audio_feature} <= rules.{audio_feature}_max)"""
+    for audio_feature in AUDIO_FEATURES
+)
 
-    base_query = """
-    SELECT DISTINCT library_tracks.track_id 
-    FROM library_tracks
-    LEFT JOIN track_artists
-        ON library_tracks.track_id = track_artists.track_id
-    LEFT JOIN artists
-        ON track_artists.artist_id = artists.id
-    LEFT JOIN artist_genres
-        ON track_artists.artist_id = artist_genres.artist_id
-    LEFT JOIN track_audio_features
-        ON library_tracks.track_id = track_audio_features.track_id
-    """
+_PLAY_COUNT = """COALESCE(
+    CASE
+        WHEN rules.play_count_days IS NULL
+        THEN track_last_played.play_count
+        ELSE windowed_plays.play_count
+    END, 0)"""
 
-    filters = " AND\n".join(
-        filter(
-            lambda x: x, [genres_filter, artists_filter, audio_features_filter]
-        )
-    )
+# Every criterion is a column of playlist_rules, so the text of this query
+# never changes - DuckDB plans it the same way for any set of configs, and
+# names or genres with quotes in them are just values. Play stats read the
+# summaries kept up to date as plays are recorded, never play_history.
+ROOT_PLAYLISTS_QUERY = f"""
+WITH windowed_plays AS (
+    SELECT rules.name, tdp.track_id, SUM(tdp.play_count) AS play_count
+    FROM playlist_rules AS rules
+    INNER JOIN track_daily_plays AS tdp
+        ON tdp.play_date > CURRENT_DATE - rules.play_count_days
+    GROUP BY rules.name, tdp.track_id
+), monthly_ranks AS (
+    SELECT
+        track_id,
+        ROW_NUMBER() OVER (
+            ORDER BY SUM(play_count) DESC, track_id
+        ) AS month_rank
+    FROM track_daily_plays
+    WHERE play_date >= DATE_TRUNC('month', CURRENT_DATE)
+    GROUP BY track_id
+)
+SELECT DISTINCT track_facts.track_id, rules.name
+FROM track_facts
+CROSS JOIN playlist_rules AS rules
+LEFT JOIN track_last_played
+    ON track_facts.track_id = track_last_played.track_id
+LEFT JOIN windowed_plays
+    ON
+        windowed_plays.name = rules.name AND
+        windowed_plays.track_id = track_facts.track_id
+LEFT JOIN monthly_ranks
+    ON track_facts.track_id = monthly_ranks.track_id
+WHERE
+    (rules.genres IS NULL OR
+        LIST_HAS_ANY(track_facts.genres, rules.genres)) AND
+    (rules.artists IS NULL OR
+        LIST_HAS_ANY(track_facts.artist_names, rules.artists)) AND
+    {_AUDIO_FEATURE_PREDICATES} AND
+    (rules.play_count_min IS NULL OR
+        {_PLAY_COUNT} >= rules.play_count_min) AND
+    (rules.play_count_max IS NULL OR
+        {_PLAY_COUNT} <= rules.play_count_max) AND
+    (rules.not_played_in_days IS NULL OR
+        track_last_played.last_played_at IS NULL OR
+        DATE_DIFF('day', track_last_played.last_played_at, CURRENT_DATE)
+            >= rules.not_played_in_days) AND
+    (rules.added_in_days IS NULL OR
+        DATE_DIFF('day', track_facts.date_added, CURRENT_DATE)
+            <= rules.added_in_days) AND
+    (rules.most_played_this_month IS NULL OR
+        monthly_ranks.month_rank <= rules.most_played_this_month)
+"""
 
-    query = "\n".join(
-        [
-            base_query,
-            "WHERE",
-            filters,
-        ]
-    )
 
-    logger.info(f"Executing query: {query}")
+def make_root_playlist(
+    database: DuckDBPyConnection,
+    playlist_config: PlaylistConfig,
+    logger=logger,
+) -> pl.DataFrame:
+    return make_root_playlists(
+        database, [playlist_config], logger=logger
+    ).select("track_id")
+
 
-    base_root_playlist_tracks = database.sql(query).pl()
-    return base_root_playlist_tracks
+def make_root_playlists(
+    database: DuckDBPyConnection,
+    playlist_configs: List[PlaylistConfig],
+    logger=logger,
+) -> pl.DataFrame:
+    """Builds every root playlist in one query, returning (track_id, name)
+    rows for all of them.
+
+    The configs are bound as the playlist_rules relation rather than
+    compiled into the SQL, so adding a playlist adds a row, not a predicate.
+    """
+    if not playlist_configs:
+        return pl.DataFrame(schema={"track_id": pl.Utf8, "name": pl.Utf8})
+    playlist_rules = playlist_rules_frame(playlist_configs)  # noqa
+    logger.info(f"Evaluating {len(playlist_configs)} playlist configs.")
+    return database.execute(ROOT_PLAYLISTS_QUERY).pl()
 
 
 # for testing, this is a fairly complicated query to automate.
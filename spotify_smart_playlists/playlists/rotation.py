@@ -0,0 +1,143 @@
+import numpy as np
+from dataclasses import dataclass, fields
+from duckdb import DuckDBPyConnection
+from typing import Dict, List
+from .root_playlist import RotationConfig
+
+ROTATION_POLICY_FIELDS = [f.name for f in fields(RotationConfig)]
+
+
+@dataclass
+class RotationSnapshot:
+    """Every root playlist's tracks with their play stats, one row per
+    (playlist, track) and grouped by playlist, loaded once per run.
+
+    Days are NaN where there's nothing to count from.
+    """
+
+    names: np.ndarray
+    name_codes: np.ndarray
+    track_ids: np.ndarray
+    days_since_played: np.ndarray
+    play_count: np.ndarray
+    days_since_added: np.ndarray
+
+    def __len__(self) -> int:
+        return self.track_ids.shape[0]
+
+
+def load_rotation_snapshot(database: DuckDBPyConnection) -> RotationSnapshot:
+    rows = database.sql(
+        """
+        SELECT
+            rp.name,
+            rp.track_id,
+            DATE_DIFF('day', tlp.last_played_at, CURRENT_DATE)::DOUBLE
+                AS days_since_played,
+            COALESCE(tlp.play_count, 0) AS play_count,
+            DATE_DIFF('day', lt.date_added, CURRENT_DATE)::DOUBLE
+                AS days_since_added
+        FROM root_playlists AS rp
+        LEFT JOIN track_last_played AS tlp
+            ON rp.track_id = tlp.track_id
+        LEFT JOIN library_tracks AS lt
+            ON rp.track_id = lt.track_id
+        ORDER BY rp.name, rp.track_id
+        """
+    ).pl()
+    names, name_codes = np.unique(
+        rows.get_column("name").to_numpy(), return_inverse=True
+    )
+    return RotationSnapshot(
+        names=names,
+        name_codes=name_codes,
+        track_ids=rows.get_column("track_id").to_numpy(),
+        days_since_played=rows.get_column("days_since_played")
+        .fill_null(np.nan)
+        .to_numpy(),
+        play_count=rows.get_column("play_count").to_numpy(),
+        days_since_added=rows.get_column("days_since_added")
+        .fill_null(np.nan)
+        .to_numpy(),
+    )
+
+
+def _policy_arrays(
+    names: np.ndarray, policies: Dict[str, RotationConfig]
+) -> Dict[str, np.ndarray]:
+    # One value per playlist, indexed by name code.
+    default = RotationConfig()
+    return {
+        field: np.array(
+            [
+                getattr(policies.get(name, default), field)
+                for name in names.tolist()
+            ],
+            dtype=np.float64,
+        )
+        for field in ROTATION_POLICY_FIELDS
+    }
+
+
+def rotation_weights(
+    snapshot: RotationSnapshot, policies: Dict[str, RotationConfig]
+) -> np.ndarray:
+    """Sampling weight of every row of the snapshot under its playlist's
+    policy, zero for tracks still cooling down.
+    """
+    policy = {
+        field: values[snapshot.name_codes]
+        for field, values in _policy_arrays(snapshot.names, policies).items()
+    }
+    played = ~np.isnan(snapshot.days_since_played)
+    eligible = ~played | (snapshot.days_since_played > policy["cooldown_days"])
+
+    # Never played tracks have been waiting since they were saved.
+    days_waiting = np.where(
+        played, snapshot.days_since_played, snapshot.days_since_added
+    )
+    days_waiting = np.maximum(np.nan_to_num(days_waiting, nan=1.0), 1.0)
+    weights = days_waiting ** policy["recency_weight"]
+    weights /= (1.0 + snapshot.play_count) ** policy["rarity_weight"]
+    fresh = snapshot.days_since_added <= policy["freshness_days"]
+    weights *= np.where(fresh, 1.0 + policy["freshness_boost"], 1.0)
+    return np.where(eligible, weights, 0.0)
+
+
+def select_rotations(
+    snapshot: RotationSnapshot,
+    policies: Dict[str, RotationConfig],
+    num_tracks: int = 25,
+    rng: np.random.Generator | None = None,
+) -> Dict[str, List[str]]:
+    """Samples up to num_tracks tracks per playlist without replacement,
+    each with probability proportional to its rotation weight. Playlists
+    with no eligible tracks are left out.
+
+    Every playlist is sampled at once: each row gets an Efraimidis-Spirakis
+    key log(u) / weight, and a playlist's sample is its num_tracks largest
+    keys.
+    """
+    rng = rng or np.random.default_rng()
+    weights = rotation_weights(snapshot, policies)
+    eligible = weights > 0
+    keys = np.full(len(snapshot), -np.inf)
+    keys[eligible] = (
+        np.log(1.0 - rng.random(int(eligible.sum()))) / weights[eligible]
+    )
+
+    # Rows by playlist, then largest key first.
+    order = np.lexsort((-keys, snapshot.name_codes))
+    codes = snapshot.name_codes[order]
+    group_starts = np.searchsorted(codes, np.arange(len(snapshot.names)))
+    rank = np.arange(len(order)) - group_starts[codes]
+    selected = order[(rank < num_tracks) & eligible[order]]
+
+    names = snapshot.names.tolist()
+    rotations: Dict[str, List[str]] = {}
+    for code, track_id in zip(
+        snapshot.name_codes[selected].tolist(),
+        snapshot.track_ids[selected].tolist(),
+    ):
+        rotations.setdefault(names[code], []).append(track_id)
+    return rotations
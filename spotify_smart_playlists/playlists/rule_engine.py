@@ -0,0 +1,288 @@
+import numpy as np
+import polars as pl
+from dataclasses import dataclass
+from datetime import date
+from duckdb import DuckDBPyConnection
+from loguru import logger
+from typing import Dict, List, Tuple
+from .root_playlist import AUDIO_FEATURES, PlayStatsConfig, PlaylistConfig
+
+
+@dataclass
+class TrackFactsSnapshot:
+    """track_facts (plus play stats) loaded into arrays, for evaluating
+    playlist configs in memory.
+
+    Audio features are one contiguous row per feature so each min/max is a
+    single pass over one array. Artists and genres are bitsets over an
+    interned vocabulary, one row of uint64 words per track.
+    """
+
+    track_ids: np.ndarray
+    audio_features: np.ndarray
+    artist_bits: np.ndarray
+    artist_vocabulary: Dict[str, int]
+    genre_bits: np.ndarray
+    genre_vocabulary: Dict[str, int]
+    date_added: np.ndarray
+    last_played_at: np.ndarray
+    play_count: np.ndarray
+    # track_daily_plays, which covers tracks outside the library too. Plays
+    # for those have a library index of -1 but still count for rankings.
+    daily_library_index: np.ndarray
+    daily_track_rank: np.ndarray
+    daily_play_date: np.ndarray
+    daily_play_count: np.ndarray
+
+    def __len__(self) -> int:
+        return self.track_ids.shape[0]
+
+
+def _bitsets(lists: pl.Series) -> Tuple[np.ndarray, Dict[str, int]]:
+    exploded = (
+        pl.DataFrame({"row": np.arange(len(lists)), "value": lists})
+        .explode("value")
+        .drop_nulls("value")
+    )
+    vocabulary, codes = np.unique(
+        exploded.get_column("value").to_numpy(), return_inverse=True
+    )
+    words = max(1, -(-len(vocabulary) // 64))
+    bits = np.zeros((len(lists), words), dtype=np.uint64)
+    np.bitwise_or.at(
+        bits,
+        (exploded.get_column("row").to_numpy(), codes // 64),
+        np.left_shift(np.uint64(1), (codes % 64).astype(np.uint64)),
+    )
+    return bits, {value: i for i, value in enumerate(vocabulary)}
+
+
+def _query_bits(
+    values: List[str], vocabulary: Dict[str, int], words: int
+) -> np.ndarray:
+    query = np.zeros(words, dtype=np.uint64)
+    for value in values:
+        if value in vocabulary:
+            code = vocabulary[value]
+            query[code // 64] |= np.uint64(1) << np.uint64(code % 64)
+    return query
+
+
+def _has_any(bits: np.ndarray, query: np.ndarray) -> np.ndarray:
+    # Only the words the query touches need looking at.
+    words = np.flatnonzero(query)
+    if not words.size:
+        return np.zeros(bits.shape[0], dtype=bool)
+    return (bits[:, words] & query[words]).any(axis=1)
+
+
+def load_track_facts_snapshot(
+    database: DuckDBPyConnection,
+) -> TrackFactsSnapshot:
+    track_facts = database.sql(
+        f"""
+        SELECT
+            track_facts.track_id,
+            track_facts.date_added,
+            {", ".join(AUDIO_FEATURES)},
+            track_facts.artist_names,
+            track_facts.genres,
+            track_last_played.last_played_at,
+            COALESCE(track_last_played.play_count, 0) AS play_count
+        FROM track_facts
+        LEFT JOIN track_last_played
+            ON track_facts.track_id = track_last_played.track_id
+        ORDER BY track_facts.track_id
+        """
+    ).pl()
+    track_ids = track_facts.get_column("track_id").to_numpy()
+    audio_features = np.ascontiguousarray(
+        track_facts.select(
+            [pl.col(f).cast(pl.Float64) for f in AUDIO_FEATURES]
+        )
+        .to_numpy()
+        .T
+    )
+    artist_bits, artist_vocabulary = _bitsets(
+        track_facts.get_column("artist_names")
+    )
+    genre_bits, genre_vocabulary = _bitsets(track_facts.get_column("genres"))
+
+    daily_plays = database.sql(
+        """
+        SELECT track_id, play_date, play_count FROM track_daily_plays
+        """
+    ).pl()
+    daily_track_ids = daily_plays.get_column("track_id").to_numpy()
+    # Rank of each play's track id, for breaking ties the way ORDER BY
+    # track_id does.
+    _, daily_track_rank = np.unique(daily_track_ids, return_inverse=True)
+    library_index = np.searchsorted(track_ids, daily_track_ids)
+    library_index = np.minimum(library_index, len(track_ids) - 1)
+    in_library = (
+        track_ids[library_index] == daily_track_ids
+        if len(track_ids)
+        else np.zeros(len(daily_track_ids), dtype=bool)
+    )
+
+    return TrackFactsSnapshot(
+        track_ids=track_ids,
+        audio_features=audio_features,
+        artist_bits=artist_bits,
+        artist_vocabulary=artist_vocabulary,
+        genre_bits=genre_bits,
+        genre_vocabulary=genre_vocabulary,
+        date_added=track_facts.get_column("date_added")
+        .cast(pl.Date)
+        .to_numpy()
+        .astype("datetime64[D]"),
+        last_played_at=track_facts.get_column("last_played_at")
+        .cast(pl.Date)
+        .to_numpy()
+        .astype("datetime64[D]"),
+        play_count=track_facts.get_column("play_count").to_numpy(),
+        daily_library_index=np.where(in_library, library_index, -1),
+        daily_track_rank=daily_track_rank,
+        daily_play_date=daily_plays.get_column("play_date")
+        .to_numpy()
+        .astype("datetime64[D]"),
+        daily_play_count=daily_plays.get_column("play_count").to_numpy(),
+    )
+
+
+def _play_stats_mask(
+    snapshot: TrackFactsSnapshot, play_stats: PlayStatsConfig, today: date
+) -> np.ndarray:
+    today_day = np.datetime64(today, "D")
+    mask = np.ones(len(snapshot), dtype=bool)
+    play_count = play_stats.play_count
+    if play_count is not None:
+        if play_count.days is None:
+            counts = snapshot.play_count
+        else:
+            in_window = (
+                snapshot.daily_play_date > today_day - play_count.days
+            ) & (snapshot.daily_library_index >= 0)
+            counts = np.bincount(
+                snapshot.daily_library_index[in_window],
+                weights=snapshot.daily_play_count[in_window],
+                minlength=len(snapshot),
+            )
+        if play_count.min is not None:
+            mask &= counts >= play_count.min
+        if play_count.max is not None:
+            mask &= counts <= play_count.max
+    if play_stats.not_played_in_days is not None:
+        # NaT (never played) compares false, so it's let through
+        # explicitly.
+        days_since_played = (today_day - snapshot.last_played_at).astype(
+            "timedelta64[D]"
+        )
+        mask &= np.isnat(snapshot.last_played_at) | (
+            days_since_played >= np.timedelta64(play_stats.not_played_in_days)
+        )
+    if play_stats.added_in_days is not None:
+        mask &= (today_day - snapshot.date_added) <= np.timedelta64(
+            play_stats.added_in_days
+        )
+    if play_stats.most_played_this_month is not None:
+        month_start = np.datetime64(today, "M").astype("datetime64[D]")
+        this_month = snapshot.daily_play_date >= month_start
+        monthly_counts = np.bincount(
+            snapshot.daily_track_rank[this_month],
+            weights=snapshot.daily_play_count[this_month],
+            minlength=snapshot.daily_track_rank.max(initial=-1) + 1,
+        )
+        played = np.flatnonzero(monthly_counts > 0)
+        # Most plays first, then track id - the same order as the SQL.
+        top_ranks = played[np.argsort(-monthly_counts[played], kind="stable")][
+            : play_stats.most_played_this_month
+        ]
+        rank_to_library = np.full(monthly_counts.shape[0], -1)
+        rank_to_library[
+            snapshot.daily_track_rank
+        ] = snapshot.daily_library_index
+        top_tracks = rank_to_library[top_ranks]
+        top_mask = np.zeros(len(snapshot), dtype=bool)
+        top_mask[top_tracks[top_tracks >= 0]] = True
+        mask &= top_mask
+    return mask
+
+
+def evaluate_playlist(
+    snapshot: TrackFactsSnapshot,
+    playlist_config: PlaylistConfig,
+    today: date | None = None,
+) -> np.ndarray:
+    """Returns a boolean mask over the snapshot's tracks for the tracks
+    make_root_playlist would select.
+    """
+    today = today or date.today()
+    mask = np.ones(len(snapshot), dtype=bool)
+    if playlist_config.genres:
+        mask &= _has_any(
+            snapshot.genre_bits,
+            _query_bits(
+                playlist_config.genres,
+                snapshot.genre_vocabulary,
+                snapshot.genre_bits.shape[1],
+            ),
+        )
+    if playlist_config.artists:
+        mask &= _has_any(
+            snapshot.artist_bits,
+            _query_bits(
+                playlist_config.artists,
+                snapshot.artist_vocabulary,
+                snapshot.artist_bits.shape[1],
+            ),
+        )
+    if playlist_config.audio_features is not None:
+        for i, audio_feature in enumerate(AUDIO_FEATURES):
+            audio_feature_config = getattr(
+                playlist_config.audio_features, audio_feature
+            )
+            if audio_feature_config is None:
+                continue
+            # Missing features are NaN, which fails both comparisons just
+            # like NULL does in SQL.
+            if audio_feature_config.min is not None:
+                mask &= snapshot.audio_features[i] >= audio_feature_config.min
+            if audio_feature_config.max is not None:
+                mask &= snapshot.audio_features[i] <= audio_feature_config.max
+    if playlist_config.play_stats is not None:
+        mask &= _play_stats_mask(snapshot, playlist_config.play_stats, today)
+    return mask
+
+
+def evaluate_playlists(
+    snapshot: TrackFactsSnapshot,
+    playlist_configs: List[PlaylistConfig],
+    today: date | None = None,
+    logger=logger,
+) -> pl.DataFrame:
+    """In-memory equivalent of make_root_playlists, returning (track_id,
+    name) rows for every playlist.
+    """
+    track_ids: List[np.ndarray] = []
+    names: List[str] = []
+    for playlist_config in playlist_configs:
+        playlist_track_ids = snapshot.track_ids[
+            evaluate_playlist(snapshot, playlist_config, today=today)
+        ]
+        logger.info(
+            f"{playlist_config.name} has {len(playlist_track_ids)} tracks."
+        )
+        track_ids.append(playlist_track_ids)
+        names.extend([playlist_config.name] * len(playlist_track_ids))
+    return pl.DataFrame(
+        {
+            "track_id": [
+                track_id
+                for playlist_track_ids in track_ids
+                for track_id in playlist_track_ids.tolist()
+            ],
+            "name": names,
+        },
+        schema={"track_id": pl.Utf8, "name": pl.Utf8},
+    )
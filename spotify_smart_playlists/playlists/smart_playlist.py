@@ -1,8 +1,10 @@
 import spotipy
-from typing import List, Optional
+from typing import Dict, List
 from loguru import logger
 from random import sample
 from duckdb import DuckDBPyConnection
+from .root_playlist import RotationConfig
+from .rotation import load_rotation_snapshot, select_rotations
 
 
 def get_recommended_tracks(
@@ -27,57 +29,37 @@ def get_recommended_tracks(
     return recommended_tracks
 
 
-def get_playlist_from_spotify(
-    spotify: spotipy.Spotify, playlist_name: str, logger=logger
-) -> Optional[str]:
+def get_playlist_index(
+    spotify: spotipy.Spotify, logger=logger
+) -> Dict[str, str]:
+    """Maps the names of the user's playlists to their ids, paging through
+    them once. If names repeat the first one listed wins, which is the
+    one a search by name would have found.
+    """
     logger.info("Getting user playlists.")
+    playlist_index: Dict[str, str] = {}
     current_user_playlists_response = spotify.current_user_playlists()
-
     while current_user_playlists_response:
         for item in current_user_playlists_response["items"]:
-            if item["name"] == playlist_name:
-                return item["id"]
-
-        logger.info(
-            f"Target playlist {playlist_name} not found - "
-            "getting next page of user playlists."
-        )
+            playlist_index.setdefault(item["name"], item["id"])
         current_user_playlists_response = spotify.next(
             current_user_playlists_response
         )
+    logger.info(f"Found {len(playlist_index)} user playlists.")
+    return playlist_index
 
-    return None
 
-
-def get_tracks_for_playlist(
-    database: DuckDBPyConnection, playlist_name: str, num_tracks: int = 25
-) -> List[str]:
-    return (
-        database.query(
-            f"""
-            WITH latest_played AS (
-                SELECT 
-                    track_id,
-                    MAX(played_at) AS played_at
-                FROM play_history
-                GROUP BY track_id
-            )
-
-            SELECT
-                rp.track_id
-            FROM root_playlists AS rp
-            INNER JOIN latest_played AS lp
-                ON lp.track_id = rp.track_id
-            WHERE
-                rp.name = '{playlist_name}' AND
-                DATE_DIFF('day', lp.played_at, CURRENT_DATE) > 14
-            ORDER BY RANDOM()
-            LIMIT {num_tracks}
-        """
-        )
-        .pl()
-        .get_column("track_id")
-        .to_list()
+def get_tracks_for_playlists(
+    database: DuckDBPyConnection,
+    policies: Dict[str, RotationConfig] | None = None,
+    num_tracks: int = 25,
+) -> Dict[str, List[str]]:
+    """Picks the rotation for every root playlist under its rotation policy
+    (the default one if it has none), returning name -> track ids.
+    Playlists with nothing eligible are left out.
+    """
+    return select_rotations(
+        load_rotation_snapshot(database), policies or {}, num_tracks
     )
 
 
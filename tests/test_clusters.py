@@ -0,0 +1,119 @@
+import duckdb
+import numpy as np
+import polars as pl
+import pytest
+from datetime import datetime
+from clusters import (
+    load_cluster_model,
+    load_feature_vectors,
+    remove_departed_tracks,
+    save_cluster_model,
+    save_cluster_playlists,
+    save_track_clusters,
+)
+from database import upsert_table
+from spotify_smart_playlists.playlists import (
+    AUDIO_FEATURES,
+    assign_clusters,
+    fit_cluster_model,
+)
+
+
+@pytest.fixture
+def database():
+    # Two well separated groups of 20 tracks, plus features for a track
+    # that's no longer in the library.
+    database = duckdb.connect()
+    rng = np.random.default_rng(0)
+    track_ids = [f"t{i:02}" for i in range(40)]
+    vectors = np.concatenate(
+        [
+            rng.normal(0.0, 0.1, (20, len(AUDIO_FEATURES))),
+            rng.normal(5.0, 0.1, (20, len(AUDIO_FEATURES))),
+        ]
+    )
+    upsert_table(
+        database,
+        "library_tracks",
+        pl.DataFrame(
+            {
+                "date_added": [datetime(2023, 1, 1)] * 40,
+                "track_id": track_ids,
+                "track_name": track_ids,
+            }
+        ),
+    )
+    upsert_table(
+        database,
+        "track_audio_features",
+        pl.DataFrame(
+            {"track_id": [*track_ids, "gone"]}
+            | {
+                feature: [*vectors[:, i].tolist(), 0.0]
+                for i, feature in enumerate(AUDIO_FEATURES)
+            }
+        ),
+    )
+    yield database
+    database.close()
+
+
+def build_clusters(database, num_clusters):
+    previous = load_cluster_model(database)
+    track_ids, vectors = load_feature_vectors(database)
+    model = fit_cluster_model(
+        vectors,
+        AUDIO_FEATURES,
+        num_clusters,
+        rng=np.random.default_rng(0),
+    )
+    save_cluster_model(database, model)
+    save_track_clusters(
+        database, track_ids, assign_clusters(model, vectors), replace_all=True
+    )
+    remove_departed_tracks(database)
+    save_cluster_playlists(database, previous.names if previous else [])
+    return model
+
+
+def test_only_library_tracks_are_clustered(database):
+    track_ids, vectors = load_feature_vectors(database)
+    assert "gone" not in track_ids.tolist()
+    assert vectors.shape == (40, len(AUDIO_FEATURES))
+
+
+def test_clusters_separate_groups(database):
+    model = build_clusters(database, 2)
+    playlists = database.sql(
+        """
+        SELECT name, LIST(track_id ORDER BY track_id) AS track_ids
+        FROM root_playlists GROUP BY name
+        """
+    ).fetchall()
+    assert len(playlists) == 2
+    assert sorted(len(track_ids) for _, track_ids in playlists) == [20, 20]
+    assert {name for name, _ in playlists} == set(model.names)
+
+    loaded = load_cluster_model(database)
+    assert loaded.names == model.names
+    np.testing.assert_allclose(loaded.centroids, model.centroids)
+
+
+def test_departed_tracks_leave_cluster_playlists(database):
+    build_clusters(database, 2)
+    database.execute("DELETE FROM library_tracks WHERE track_id = 't00'")
+    assert remove_departed_tracks(database) == 1
+    save_cluster_playlists(database, load_cluster_model(database).names)
+    assert database.sql(
+        "SELECT COUNT(*) FROM root_playlists WHERE track_id = 't00'"
+    ).fetchone() == (0,)
+    assert database.sql("SELECT COUNT(*) FROM root_playlists").fetchone() == (
+        39,
+    )
+
+
+def test_requested_clusters_survive_a_small_library(database):
+    build_clusters(database, 50)
+    model = load_cluster_model(database)
+    assert len(model.names) == 40
+    assert model.requested_clusters == 50
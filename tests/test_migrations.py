@@ -0,0 +1,132 @@
+import duckdb
+import migrations
+import pytest
+from migrations import (
+    MIGRATIONS,
+    Migration,
+    get_schema_version,
+    run_migrations,
+)
+
+
+@pytest.fixture
+def baseline_database():
+    # Shaped like a database from before the schema registry: tables made
+    # with CREATE TABLE AS, a time zone on played_at, duplicates left by
+    # retried runs and an old per-playlist table.
+    database = duckdb.connect()
+    database.execute(
+        """
+        CREATE TABLE play_history AS
+        SELECT * FROM (VALUES
+            ('a', '2023-01-01 10:00:00+00'::TIMESTAMPTZ),
+            ('a', '2023-01-01 10:00:00+00'::TIMESTAMPTZ),
+            ('a', '2023-01-01 18:00:00+00'::TIMESTAMPTZ),
+            ('a', '2023-01-03 09:00:00+00'::TIMESTAMPTZ),
+            ('b', '2023-01-02 12:00:00+00'::TIMESTAMPTZ)
+        ) AS t(track_id, played_at)
+        """
+    )
+    database.execute(
+        """
+        CREATE TABLE library_tracks AS
+        SELECT * FROM (VALUES
+            ('2022-12-01 00:00:00'::TIMESTAMP, 'a', 'Track A'),
+            ('2022-12-01 00:00:00'::TIMESTAMP, 'a', 'Track A'),
+            ('2022-12-02 00:00:00'::TIMESTAMP, 'b', 'Track B')
+        ) AS t(date_added, track_id, track_name)
+        """
+    )
+    database.execute(
+        """
+        CREATE TABLE root_playlists AS
+        SELECT * FROM (VALUES ('a', 'Mix'), ('b', 'Mix'), ('b', 'Other'))
+            AS t(track_id, name)
+        """
+    )
+    database.execute('CREATE TABLE "wu-tang" (track_id VARCHAR)')
+    yield database
+    database.close()
+
+
+def test_migrations_upgrade_baseline_database(baseline_database):
+    assert run_migrations(baseline_database) == len(MIGRATIONS)
+    assert get_schema_version(baseline_database) == MIGRATIONS[-1].version
+
+    tables = {x[0] for x in baseline_database.sql("SHOW TABLES").fetchall()}
+    assert "wu-tang" not in tables
+    assert baseline_database.sql(
+        "SELECT COUNT(*) FROM play_history"
+    ).fetchone() == (4,)
+    assert baseline_database.sql(
+        "SELECT COUNT(*) FROM library_tracks"
+    ).fetchone() == (2,)
+    # Keyed by a unique index, so a duplicate play is refused.
+    with pytest.raises(duckdb.ConstraintException):
+        baseline_database.execute(
+            "INSERT INTO play_history VALUES ('b', '2023-01-02 12:00:00')"
+        )
+    last_played = baseline_database.sql(
+        """
+        SELECT track_id, last_played_at::VARCHAR, play_count
+        FROM track_last_played ORDER BY track_id
+        """
+    ).fetchall()
+    assert last_played == [
+        ("a", "2023-01-03 09:00:00", 3),
+        ("b", "2023-01-02 12:00:00", 1),
+    ]
+    daily_plays = baseline_database.sql(
+        """
+        SELECT track_id, play_date::VARCHAR, play_count
+        FROM track_daily_plays ORDER BY track_id, play_date
+        """
+    ).fetchall()
+    assert daily_plays == [
+        ("a", "2023-01-01", 2),
+        ("a", "2023-01-03", 1),
+        ("b", "2023-01-02", 1),
+    ]
+    assert baseline_database.sql(
+        "SELECT name, cache_key FROM root_playlist_cache ORDER BY name"
+    ).fetchall() == [("Mix", None), ("Other", None)]
+
+
+def test_migrations_run_once(baseline_database):
+    run_migrations(baseline_database)
+    assert run_migrations(baseline_database) == 0
+    assert baseline_database.sql(
+        "SELECT COUNT(*) FROM schema_version"
+    ).fetchone() == (len(MIGRATIONS),)
+
+
+def test_migrations_on_empty_database():
+    database = duckdb.connect()
+    assert run_migrations(database) == len(MIGRATIONS)
+    assert database.sql(
+        "SELECT COUNT(*) FROM track_daily_plays"
+    ).fetchone() == (0,)
+
+
+def test_failed_migration_rolls_back(monkeypatch):
+    def create_scratch(database):
+        database.execute("CREATE TABLE scratch (x INTEGER)")
+
+    def fail(database):
+        database.execute("INSERT INTO scratch VALUES (1)")
+        raise RuntimeError("broken migration")
+
+    monkeypatch.setattr(
+        migrations,
+        "MIGRATIONS",
+        [
+            Migration(1, "create_scratch", create_scratch),
+            Migration(2, "fail", fail),
+        ],
+    )
+    database = duckdb.connect()
+    with pytest.raises(RuntimeError):
+        run_migrations(database)
+    # The first one stays applied, the second left nothing behind.
+    assert get_schema_version(database) == 1
+    assert database.sql("SELECT COUNT(*) FROM scratch").fetchone() == (0,)
@@ -0,0 +1,49 @@
+import pytest
+from spotify_smart_playlists.helpers import AdaptivePollInterval
+
+
+def test_interval_fills_headroom_of_window():
+    poll_interval = AdaptivePollInterval(window=50, headroom=0.5)
+    # 20 plays in 1000s, 25 plays take 1250s.
+    assert poll_interval.observe(20, 1000.0) == pytest.approx(1250.0)
+
+
+def test_interval_is_clamped():
+    poll_interval = AdaptivePollInterval(min_interval=60, max_interval=1800)
+    assert poll_interval.observe(1, 10_000.0) == 1800
+    assert poll_interval.observe(40, 1.0) == 60
+
+
+def test_rate_is_smoothed():
+    poll_interval = AdaptivePollInterval(smoothing=0.5)
+    poll_interval.observe(10, 100.0)
+    poll_interval.observe(30, 100.0)
+    assert poll_interval.rate == pytest.approx(0.2)
+
+
+def test_no_elapsed_time_leaves_rate_alone():
+    poll_interval = AdaptivePollInterval()
+    # A first poll catching up on a backlog says nothing about the rate.
+    assert poll_interval.observe(30, 0.0) == poll_interval.min_interval
+    assert poll_interval.rate is None
+    poll_interval.observe(5, 1000.0)
+    assert poll_interval.rate == pytest.approx(0.005)
+
+
+def test_idle_polls_back_off():
+    poll_interval = AdaptivePollInterval(
+        min_interval=60, max_interval=300, idle_backoff=2.0
+    )
+    assert [poll_interval.observe(0, 60.0) for _ in range(4)] == [
+        120,
+        240,
+        300,
+        300,
+    ]
+
+
+def test_full_window_polls_again_soon():
+    poll_interval = AdaptivePollInterval(window=50, min_interval=60)
+    poll_interval.observe(0, 60.0)
+    poll_interval.observe(0, 120.0)
+    assert poll_interval.observe(50, 240.0) == 60
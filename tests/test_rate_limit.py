@@ -0,0 +1,77 @@
+import pytest
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from spotipy import SpotifyException
+from spotify_smart_playlists.helpers.rate_limit import (
+    RateLimiter,
+    RateLimitedSpotify,
+    retry_after_seconds,
+)
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    # Answers every request with a 429, counting them on the server.
+    def do_GET(self):
+        self.server.request_count += 1
+        self.send_response(429)
+        self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def throttling_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingHandler)
+    server.request_count = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_throttled_call_is_left_to_the_limiter(throttling_server):
+    rate_limiter = RateLimiter()
+    spotify = RateLimitedSpotify(
+        auth="token", rate_limiter=rate_limiter, max_throttled_retries=0
+    )
+    host, port = throttling_server.server_address
+    with pytest.raises(SpotifyException) as e:
+        spotify._get(f"http://{host}:{port}/v1/me")
+    assert e.value.http_status == 429
+    # One request on the wire, urllib3 didn't retry it behind our back.
+    assert throttling_server.request_count == 1
+    assert rate_limiter.throttled_count == 0
+
+
+def test_throttled_call_backs_off_and_retries(throttling_server):
+    rate_limiter = RateLimiter(max_rate=10.0)
+    spotify = RateLimitedSpotify(
+        auth="token", rate_limiter=rate_limiter, max_throttled_retries=1
+    )
+    host, port = throttling_server.server_address
+    with pytest.raises(SpotifyException):
+        spotify._get(f"http://{host}:{port}/v1/me")
+    assert throttling_server.request_count == 2
+    assert rate_limiter.throttled_count == 1
+    assert rate_limiter.rate == 5.0
+
+
+def test_throttled_pauses_and_halves_rate():
+    rate_limiter = RateLimiter(max_rate=8.0, min_rate=1.0)
+    rate_limiter.throttled(retry_after=30)
+    budget = rate_limiter.budget
+    assert budget.rate == 4.0
+    assert budget.available < 1
+    assert 29 < budget.blocked_for <= 30
+    rate_limiter.succeeded()
+    assert rate_limiter.rate == pytest.approx(4.1)
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds({"Retry-After": "3"}) == 3.0
+    assert retry_after_seconds({"Retry-After": "soon"}) is None
+    assert retry_after_seconds(None) is None
@@ -0,0 +1,90 @@
+import duckdb
+import polars as pl
+import pytest
+from datetime import datetime, timedelta
+from database import upsert_table
+from spotify_smart_playlists.playlists import (
+    AUDIO_FEATURES,
+    load_audio_feature_index,
+    recommend_tracks,
+)
+from track_facts import refresh_track_facts
+
+
+@pytest.fixture
+def audio_feature_index():
+    # Tracks t0..t9 spaced out along every feature, so track i's nearest
+    # neighbours are i - 1 and i + 1. t4 was played yesterday.
+    database = duckdb.connect()
+    track_ids = [f"t{i}" for i in range(10)]
+    upsert_table(
+        database,
+        "library_tracks",
+        pl.DataFrame(
+            {
+                "date_added": [datetime(2023, 1, 1)] * 10,
+                "track_id": track_ids,
+                "track_name": track_ids,
+            }
+        ),
+    )
+    upsert_table(
+        database,
+        "track_audio_features",
+        pl.DataFrame(
+            {"track_id": track_ids}
+            | {feature: list(range(10)) for feature in AUDIO_FEATURES}
+        ),
+    )
+    upsert_table(
+        database,
+        "track_last_played",
+        pl.DataFrame(
+            {
+                "track_id": ["t4"],
+                "last_played_at": [datetime.now() - timedelta(days=1)],
+                "play_count": [3],
+            }
+        ),
+    )
+    refresh_track_facts(database)
+    yield load_audio_feature_index(database)
+    database.close()
+
+
+def test_recommends_nearest_first(audio_feature_index):
+    assert len(audio_feature_index) == 10
+    assert recommend_tracks(audio_feature_index, ["t0"], 3) == [
+        "t1",
+        "t2",
+        "t3",
+    ]
+
+
+def test_leaves_out_seeds_and_excluded(audio_feature_index):
+    recommended = recommend_tracks(
+        audio_feature_index, ["t5", "t6"], 3, exclude=["t7"]
+    )
+    # t3 and t8 are both two steps from a seed.
+    assert recommended[0] == "t4"
+    assert set(recommended[1:]) == {"t3", "t8"}
+
+
+def test_leaves_out_tracks_cooling_down(audio_feature_index):
+    recommended = recommend_tracks(
+        audio_feature_index, ["t5"], 2, cooldown_days=3
+    )
+    assert recommended == ["t6", "t3"] or recommended == ["t6", "t7"]
+    assert "t4" in recommend_tracks(
+        audio_feature_index, ["t5"], 2, cooldown_days=0
+    )
+
+
+def test_blocks_match_single_pass(audio_feature_index):
+    assert recommend_tracks(
+        audio_feature_index, ["t2", "t7"], 6, block_size=3
+    ) == recommend_tracks(audio_feature_index, ["t2", "t7"], 6)
+
+
+def test_unknown_seeds_recommend_nothing(audio_feature_index):
+    assert recommend_tracks(audio_feature_index, ["missing"], 3) == []
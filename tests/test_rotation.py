@@ -0,0 +1,145 @@
+import duckdb
+import numpy as np
+import polars as pl
+from datetime import datetime, timedelta
+from database import upsert_table
+from spotify_smart_playlists.playlists import (
+    RotationConfig,
+    get_tracks_for_playlists,
+)
+from spotify_smart_playlists.playlists.rotation import (
+    RotationSnapshot,
+    rotation_weights,
+    select_rotations,
+)
+
+NAN = float("nan")
+
+
+def make_snapshot(rows):
+    # rows: (playlist, track id, days since played, play count, days since
+    # added), grouped by playlist as load_rotation_snapshot leaves them.
+    names, name_codes = np.unique(
+        np.array([row[0] for row in rows], dtype=object), return_inverse=True
+    )
+    return RotationSnapshot(
+        names=names,
+        name_codes=name_codes,
+        track_ids=np.array([row[1] for row in rows], dtype=object),
+        days_since_played=np.array([row[2] for row in rows], dtype=float),
+        play_count=np.array([row[3] for row in rows]),
+        days_since_added=np.array([row[4] for row in rows], dtype=float),
+    )
+
+
+def test_tracks_in_cooldown_are_never_selected():
+    snapshot = make_snapshot(
+        [
+            ("A", "recent", 3.0, 5, 100.0),
+            ("A", "edge", 14.0, 2, 100.0),
+            ("A", "old", 15.0, 2, 100.0),
+            ("A", "never", NAN, 0, 10.0),
+            ("B", "recent", 3.0, 5, 100.0),
+        ]
+    )
+    policies = {"B": RotationConfig(cooldown_days=2)}
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        rotations = select_rotations(snapshot, policies, 10, rng=rng)
+        assert sorted(rotations["A"]) == ["never", "old"]
+        assert rotations["B"] == ["recent"]
+
+
+def test_playlists_with_nothing_eligible_are_left_out():
+    snapshot = make_snapshot(
+        [("A", "recent", 1.0, 1, 100.0), ("B", "old", 30.0, 1, 100.0)]
+    )
+    assert select_rotations(snapshot, {}) == {"B": ["old"]}
+
+
+def test_each_playlist_is_capped_separately():
+    snapshot = make_snapshot(
+        [("A", f"a{i}", NAN, 0, 100.0) for i in range(30)]
+        + [("B", f"b{i}", NAN, 0, 100.0) for i in range(3)]
+        + [("C", f"c{i}", NAN, 0, 100.0) for i in range(10)]
+    )
+    rotations = select_rotations(
+        snapshot, {}, num_tracks=5, rng=np.random.default_rng(1)
+    )
+    assert {name: len(tracks) for name, tracks in rotations.items()} == {
+        "A": 5,
+        "B": 3,
+        "C": 5,
+    }
+    for name, tracks in rotations.items():
+        assert len(set(tracks)) == len(tracks)
+        assert all(track.startswith(name.lower()) for track in tracks)
+
+
+def test_weights_follow_policy():
+    snapshot = make_snapshot(
+        [
+            ("A", "waited", 100.0, 0, 365.0),
+            ("A", "played_often", 100.0, 9, 365.0),
+            ("A", "fresh", NAN, 0, 5.0),
+        ]
+    )
+    policy = RotationConfig(
+        recency_weight=1.0,
+        rarity_weight=1.0,
+        freshness_boost=1.0,
+        freshness_days=30,
+    )
+    weights = rotation_weights(snapshot, {"A": policy})
+    # 100 days waiting, / (1 + 9) for plays, 5 days since saved * 2 fresh.
+    np.testing.assert_allclose(weights, [100.0, 10.0, 10.0])
+
+
+def test_sampling_favours_heavier_weights():
+    snapshot = make_snapshot(
+        [("A", "heavy", 1000.0, 0, 1000.0), ("A", "light", 20.0, 0, 1000.0)]
+    )
+    policies = {"A": RotationConfig(recency_weight=1.0)}
+    rng = np.random.default_rng(2)
+    firsts = [
+        select_rotations(snapshot, policies, 1, rng=rng)["A"][0]
+        for _ in range(500)
+    ]
+    # heavy has 50 times the weight of light.
+    assert firsts.count("heavy") > 450
+
+
+def test_rotations_from_database():
+    database = duckdb.connect()
+    now = datetime.now()
+    upsert_table(
+        database,
+        "library_tracks",
+        pl.DataFrame(
+            {
+                "date_added": [now - timedelta(days=100)] * 3,
+                "track_id": ["a", "b", "c"],
+                "track_name": ["A", "B", "C"],
+            }
+        ),
+    )
+    upsert_table(
+        database,
+        "root_playlists",
+        pl.DataFrame({"track_id": ["a", "b", "c"], "name": ["X", "X", "Y"]}),
+    )
+    upsert_table(
+        database,
+        "track_last_played",
+        pl.DataFrame(
+            {
+                "track_id": ["a", "c"],
+                "last_played_at": [now - timedelta(days=1)] * 2,
+                "play_count": [1, 1],
+            }
+        ),
+    )
+    assert get_tracks_for_playlists(database) == {"X": ["b"]}
+    assert get_tracks_for_playlists(
+        database, {"Y": RotationConfig(cooldown_days=0)}
+    ) == {"X": ["b"], "Y": ["c"]}
@@ -0,0 +1,56 @@
+import duckdb
+import polars as pl
+import pytest
+from database import upsert_table
+from schema import create_table, has_duplicate_keys
+
+
+@pytest.fixture
+def database():
+    database = duckdb.connect()
+    yield database
+    database.close()
+
+
+def test_create_table_from_schema(database):
+    create_table(database, "library_tracks")
+    create_table(database, "library_tracks")
+    columns = database.sql("DESCRIBE library_tracks").pl()
+    assert columns.get_column("column_name").to_list() == [
+        "date_added",
+        "track_id",
+        "track_name",
+    ]
+
+
+def test_create_table_keys_legacy_table_with_duplicates(database):
+    database.execute(
+        """
+        CREATE TABLE artists AS
+        SELECT * FROM (VALUES ('a', 'First'), ('a', 'Second'), ('b', 'B'))
+            AS t(id, name)
+        """
+    )
+    assert has_duplicate_keys(database, "artists")
+    database.begin()
+    create_table(database, "artists")
+    database.commit()
+    assert not has_duplicate_keys(database, "artists")
+    assert database.sql("SELECT * FROM artists ORDER BY id").fetchall() == [
+        ("a", "First"),
+        ("b", "B"),
+    ]
+    with pytest.raises(duckdb.ConstraintException):
+        database.execute("INSERT INTO artists VALUES ('b', 'Again')")
+
+
+def test_upsert_table(database):
+    artists = pl.DataFrame({"id": ["a", "b"], "name": ["A", "B"]})
+    assert upsert_table(database, "artists", artists) == 2
+    # Identical rows aren't rewritten.
+    assert upsert_table(database, "artists", artists) == 0
+    renamed = pl.DataFrame({"id": ["a"], "name": ["Renamed"]})
+    assert upsert_table(database, "artists", renamed, delete_missing=True) == 1
+    assert database.sql("SELECT * FROM artists").fetchall() == [
+        ("a", "Renamed")
+    ]
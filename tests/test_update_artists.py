@@ -0,0 +1,35 @@
+import duckdb
+import polars as pl
+from database import upsert_table
+from update_artists import get_missing_artists, record_artist_fetches
+
+
+def test_unknown_artists_wait_for_refresh():
+    database = duckdb.connect()
+    upsert_table(
+        database,
+        "track_artists",
+        pl.DataFrame(
+            {"track_id": ["t1", "t1", "t2"], "artist_id": ["a", "b", "c"]}
+        ),
+    )
+    assert sorted(get_missing_artists(database, False, 30)) == ["a", "b", "c"]
+
+    # Spotify returned "a" and "b", and null for "c".
+    upsert_table(
+        database, "artists", pl.DataFrame({"id": ["a", "b"], "name": "A"})
+    )
+    record_artist_fetches(database, ["a", "b", "c", "c"])
+    assert get_missing_artists(database, True, 30) == []
+    assert database.sql("SELECT COUNT(*) FROM artist_fetches").fetchone() == (
+        3,
+    )
+
+    database.execute(
+        """
+        UPDATE artist_fetches
+        SET fetched_at = fetched_at - INTERVAL 31 DAY
+        WHERE artist_id = 'c'
+        """
+    )
+    assert get_missing_artists(database, True, 30) == ["c"]